@@ -1,24 +1,78 @@
 """Caching support."""
 import gzip
 import hashlib
-import json
+import os
+import tempfile
+import threading
 import time
 
+from collections import OrderedDict
+from importlib.util import find_spec
 from pathlib import Path
-from typing import Any, Optional, Type, Union
+from typing import IO, Any, List, Optional, Union, cast
 
 import appdirs
 import pandas as pd
 import requests
 
 
+try:
+    from orjson import loads as json_loads
+except ImportError:  # pragma: no cover
+    from json import loads as json_loads  # type: ignore[assignment]
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore[assignment]
+
+
+#: Headers for requests that pandas makes on our behalf. Unlike ``requests``,
+#: pandas doesn't ask for compressed responses by default, and it can only
+#: decode gzip, so that is the only encoding advertised.
+PANDAS_HTTP_HEADERS = {"Accept-Encoding": "gzip"}
+
+#: The fastest CSV parser pandas can use here. pyarrow's reader is
+#: multithreaded and several times faster than the C engine on large ERDDAP
+#: responses, but it is an optional dependency. It also infers some column
+#: types differently (ISO timestamps become datetimes), so it is only used for
+#: internal reads whose dtypes don't reach users.
+CSV_ENGINE = "pyarrow" if find_spec("pyarrow") is not None else "c"
+
+#: Size of the pieces a response body is streamed to disk in.
+CHUNK_SIZE = 1024 * 1024
+
+#: Suffix of newly written cache files. Responses are compressed with zstd
+#: when ``zstandard`` is installed and with gzip otherwise.
+CACHE_SUFFIX = ".gz" if zstandard is None else ".zst"
+#: Suffixes of every cache file format that can be read back.
+CACHE_SUFFIXES = (".gz", ".zst")
+
+
+def open_cache_file(path: Path, mode: str = "rb") -> IO[bytes]:
+    """Open a cache file with the codec matching its suffix."""
+    if path.suffix == ".zst":
+        if "w" in mode:
+            return zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=3))
+        return zstandard.open(path, mode)
+    return cast(IO[bytes], gzip.open(path, mode))
+
+
+#: Number of parsed cache files kept in memory. Catalogs built repeatedly in
+#: one process for the same searches reuse these instead of decompressing and
+#: parsing the cached CSV again.
+PARSED_CSV_CACHE_SIZE = 128
+_PARSED_CSV: "OrderedDict[tuple, pd.DataFrame]" = OrderedDict()
+_PARSED_CSV_LOCK = threading.Lock()
+
+
 class CacheStore:
     """A caching mechanism to store HTTP responses in a local cache."""
 
     def __init__(
         self,
         cache_dir: Optional[Path] = None,
-        http_client: Optional[Type] = None,
+        http_client: Optional[Any] = None,
         cache_period: Optional[Union[int, float]] = None,
     ):
         self.cache_dir: Path = cache_dir or Path(
@@ -41,16 +95,46 @@ class CacheStore:
     def cache_file(self, url: str) -> Path:
         """Return the path to the cache file."""
         checksum = self.hash_url(url)
-        filename = self.cache_dir / f"{checksum}.gz"
+        filename = self.cache_dir / f"{checksum}{CACHE_SUFFIX}"
         return filename
 
     def cache_response(self, url: str, *args, **kwargs):
-        """Write the content of the HTTP response to a gzipped cached file."""
+        """Stream the content of the HTTP response into a compressed cache file."""
         filename = self.cache_file(url)
-        resp = self.http_client.get(url, *args, **kwargs)
-        resp.raise_for_status()
-        with gzip.open(filename, "wb") as f:
-            f.write(resp.content)
+        resp = self.http_client.get(url, *args, **{"stream": True, **kwargs})
+        try:
+            resp.raise_for_status()
+            # Write next to the target and move it into place once complete, so
+            # an interrupted download never looks like a fresh cache file.
+            with tempfile.NamedTemporaryFile(
+                dir=self.cache_dir, prefix=".", suffix=CACHE_SUFFIX, delete=False
+            ) as tmp:
+                partial = Path(tmp.name)
+            try:
+                with open_cache_file(partial, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                os.replace(partial, filename)
+            except BaseException:
+                partial.unlink()
+                raise
+        finally:
+            resp.close()
+        return filename
+
+    def fresh_cache_file(self, url: str, http_kwargs: Optional[dict] = None) -> Path:
+        """Return the path to an unexpired cache file, fetching it if needed.
+
+        Files left behind in another format, e.g. gzip files from before zstd
+        was available, are still used until they expire.
+        """
+        allowed_mtime = time.time() - self.cache_period
+        pth = self.cache_file(url)
+        others = [pth.with_suffix(sfx) for sfx in CACHE_SUFFIXES if sfx != pth.suffix]
+        for candidate in [pth, *others]:
+            if candidate.exists() and candidate.stat().st_mtime >= allowed_mtime:
+                return candidate
+        return self.cache_response(url, **(http_kwargs or {}))
 
     def cache_enabled(self) -> bool:
         """Returns true if the store should use the cache."""
@@ -63,21 +147,37 @@ class CacheStore:
         http_kwargs: Optional[dict] = None,
     ) -> pd.DataFrame:
         """Return a pandas data frame read from source or cache."""
-        pandas_kwargs = pandas_kwargs or {}
+        pandas_kwargs = dict(pandas_kwargs or {})
+        if pandas_kwargs.get("engine", "c") == "c":
+            # Parse in one pass instead of in chunks that each infer types.
+            pandas_kwargs.setdefault("low_memory", False)
         http_kwargs = http_kwargs or {}
         if not self.cache_enabled():
-            return pd.read_csv(url, **pandas_kwargs)
-        pth = self.cache_file(url)
-        now = time.time()
-        allowed_mtime = now - self.cache_period
-        if pth.exists():
-            if pth.stat().st_mtime < allowed_mtime:
-                self.cache_response(url, **http_kwargs)
-        else:
-            self.cache_response(url, **http_kwargs)
-
-        with gzip.open(pth) as f:
-            return pd.read_csv(f, **pandas_kwargs)
+            return pd.read_csv(
+                url, **{"storage_options": PANDAS_HTTP_HEADERS, **pandas_kwargs}
+            )
+        pth = self.fresh_cache_file(url, http_kwargs)
+        # Keyed on the file's identity as well as its path so that a refreshed
+        # cache file is parsed again.
+        stat = pth.stat()
+        key = (
+            str(pth),
+            stat.st_mtime_ns,
+            stat.st_size,
+            repr(sorted(pandas_kwargs.items())),
+        )
+        with _PARSED_CSV_LOCK:
+            df = _PARSED_CSV.get(key)
+            if df is not None:
+                _PARSED_CSV.move_to_end(key)
+        if df is None:
+            with open_cache_file(pth) as f:
+                df = pd.read_csv(f, **pandas_kwargs)
+            with _PARSED_CSV_LOCK:
+                _PARSED_CSV[key] = df
+                while len(_PARSED_CSV) > PARSED_CSV_CACHE_SIZE:
+                    _PARSED_CSV.popitem(last=False)
+        return df.copy()
 
     def read_json(self, url: str, http_kwargs: Optional[dict] = None) -> Any:
         """Return the parsed JSON object from source or cache."""
@@ -85,18 +185,10 @@ class CacheStore:
         if not self.cache_enabled():
             resp = self.http_client.get(url, **http_kwargs)
             resp.raise_for_status()
-            return resp.json()
-        pth = self.cache_file(url)
-        now = time.time()
-        allowed_mtime = now - self.cache_period
-        if pth.exists():
-            if pth.stat().st_mtime < allowed_mtime:
-                self.cache_response(url, **http_kwargs)
-        else:
-            self.cache_response(url, **http_kwargs)
-
-        with gzip.open(pth) as f:
-            return json.load(f)
+            return json_loads(resp.content)
+        pth = self.fresh_cache_file(url, http_kwargs)
+        with open_cache_file(pth) as f:
+            return json_loads(f.read())
 
     def clear_cache(self, mtime: Optional[Union[int, float]] = None):
         """Removes all cached files."""
@@ -108,14 +200,26 @@ class CacheStore:
 
     def _clear_cache(self):
         """Removes all cached files."""
-        for cache_file in self.cache_dir.glob("*.gz"):
-            cache_file.unlink()
+        for entry in self._cache_entries():
+            os.unlink(entry.path)
 
     def _clear_cache_mtime(self, age: Union[int, float]):
         """Removes cached files older than ``age`` seconds."""
         current_time = time.time()
         cutoff = current_time - age
-        for cache_file in self.cache_dir.glob("*.gz"):
-            mtime = cache_file.stat().st_mtime
-            if mtime <= cutoff:
-                cache_file.unlink()
+        for entry in self._cache_entries():
+            if entry.stat().st_mtime <= cutoff:
+                os.unlink(entry.path)
+
+    def _cache_entries(self) -> List[os.DirEntry]:
+        """Returns the cached files in every readable format.
+
+        The directory is listed once with ``os.scandir``, whose entries reuse
+        the type information from the listing instead of a stat per file.
+        """
+        with os.scandir(self.cache_dir) as it:
+            return [
+                entry
+                for entry in it
+                if entry.name.endswith(CACHE_SUFFIXES) and entry.is_file()
+            ]
@@ -3,17 +3,21 @@
 from logging import getLogger
 from typing import List, Union
 
-import cf_pandas  # noqa: F401
 import fsspec
+import numpy as np
 import pandas as pd
-import requests
 import xarray as xr
 
 from erddapy import ERDDAP
 from intake.readers.readers import BaseReader
 
+from intake_erddap.cache import json_loads
+from intake_erddap.utils import HTTP_TIMEOUT, get_session
+
 
 log = getLogger("intake-erddap")
+# Seconds to wait on ERDDAP while downloading a dataset's data.
+DOWNLOAD_TIMEOUT = 60
 
 
 class ERDDAPReader(BaseReader):
@@ -41,7 +45,10 @@ class ERDDAPReader(BaseReader):
         `requests` interface.
     open_kwargs : dict, optional
         Keyword arguments to pass on to the open function like `e.to_pandas`
-        for a DataFrame. For example, {"parse_dates": True}
+        for a DataFrame. For example, {"parse_dates": True}. Pass
+        {"engine": "pyarrow"} for a faster parse of large downloads if pyarrow
+        is installed; note that it infers other column types than the default
+        engine, e.g. ISO time columns come back as datetimes.
 
     Note
     ----
@@ -102,6 +109,11 @@ class TableDAPReader(ERDDAPReader):
         locally in a cache, use this keyword to input a dictionary of keywords.
         The cache is set up using ``fsspec``'s simple cache. Example configuration
         is ``cache_kwargs=dict(cache_storage="/tmp/fnames/", same_names=True)``.
+    chunksize : int, optional
+        If given, the data is downloaded and parsed this many rows at a time,
+        with ``mask_failed_qartod`` and ``dropna`` applied to each chunk before
+        the chunks are combined. This lowers peak memory use for large
+        datasets at some cost in speed.
 
     Examples
     --------
@@ -143,9 +155,11 @@ class TableDAPReader(ERDDAPReader):
         cache_kwargs=None,
         open_kwargs=None,
         constraints=None,
+        chunksize=None,
         **kw,
     ):
-        open_kwargs = open_kwargs or {}
+        # Copied, as the catalog passes the same dict to every entry.
+        open_kwargs = dict(open_kwargs or {})
         variables = variables or []
         kw.pop("protocol", None)
         protocol = kw.pop("protocol", "tabledap")
@@ -176,6 +190,10 @@ class TableDAPReader(ERDDAPReader):
 
             try:
                 with fsspec.open(f"simplecache://::{url}", **(cache_kwargs or {})) as f:
+                    if chunksize is not None:
+                        return self._read_chunks(
+                            f, chunksize, open_kwargs, mask_failed_qartod, dropna
+                        )
                     dataframe: pd.DataFrame = pd.read_csv(f, **open_kwargs)
             except OSError as e:  # might get file name too long
                 print(e)
@@ -183,19 +201,50 @@ class TableDAPReader(ERDDAPReader):
                     "If your filenames are too long, input only a few variables"
                     "to return or input into cache kwargs `same_names=False`"
                 )
+        elif chunksize is not None:
+            url = e.get_download_url(
+                response=open_kwargs.pop("response", "csvp"),
+                distinct=open_kwargs.pop("distinct", False),
+            )
+            resp = get_session().get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+            with resp:
+                resp.raise_for_status()
+                resp.raw.decode_content = True
+                return self._read_chunks(
+                    resp.raw, chunksize, open_kwargs, mask_failed_qartod, dropna
+                )
         else:
             dataframe: pd.DataFrame = e.to_pandas(
-                requests_kwargs={"timeout": 60}, **open_kwargs
+                requests_kwargs={"timeout": DOWNLOAD_TIMEOUT}, **open_kwargs
+            )
+        return self._process(dataframe, mask_failed_qartod, dropna)
+
+    def _read_chunks(
+        self, source, chunksize, pandas_kwargs, mask_failed_qartod, dropna
+    ) -> pd.DataFrame:
+        """Read the CSV ``chunksize`` rows at a time, processing each chunk.
+
+        Masking and dropping rows as each chunk arrives means the unfiltered
+        table never has to be held in memory all at once.
+        """
+        with pd.read_csv(source, chunksize=chunksize, **pandas_kwargs) as chunks:
+            return pd.concat(
+                [self._process(chunk, mask_failed_qartod, dropna) for chunk in chunks]
             )
+
+    def _process(self, df, mask_failed_qartod, dropna) -> pd.DataFrame:
+        """Apply the optional QARTOD masking and dropna steps."""
         if mask_failed_qartod:
-            dataframe = self.run_mask_failed_qartod(dataframe)
+            df = self.run_mask_failed_qartod(df)
         if dropna:
-            dataframe = self.run_dropna(dataframe)
-        return dataframe
+            df = self.run_dropna(df)
+        return df
 
     @staticmethod
     def data_cols(df):
         """Columns that are not axes, coordinates, nor qc_agg columns."""
+        # Registers the ``.cf`` accessor; only needed here, so import it late.
+        import cf_pandas  # noqa: F401
 
         # find data columns which are what we'll use in the final step to drop nan's
         # don't include dimension/coordinates-type columns (dimcols) nor qc_agg columns (qccols)
@@ -212,13 +261,18 @@ class TableDAPReader(ERDDAPReader):
         """
 
         # if a data column has an associated qc column, use it to weed out bad data by
-        # setting it to nan.
-        for datacol in self.data_cols(df):
-            qccol = f"{datacol}_qc_agg"
-            if qccol in df.columns:
-                df.loc[~df[qccol].isin([1, 2]), datacol] = pd.NA
-                df.drop(columns=[qccol], inplace=True)
-        return df
+        # setting it to nan. All pairs are masked in one pass over a 2D array.
+        pairs = [
+            (datacol, f"{datacol}_qc_agg")
+            for datacol in self.data_cols(df)
+            if f"{datacol}_qc_agg" in df.columns
+        ]
+        if not pairs:
+            return df
+        datacols, qccols = map(list, zip(*pairs))
+        failed = ~np.isin(df[qccols].to_numpy(), [1, 2])
+        df[datacols] = df[datacols].mask(failed)
+        return df.drop(columns=qccols)
 
     def run_dropna(self, df):
         """Drop nan rows based on the data columns."""
@@ -227,10 +281,14 @@ class TableDAPReader(ERDDAPReader):
     def _get_dataset_metadata(self, server, dataset_id) -> dict:
         """Fetch and return the metadata document for the dataset."""
         url = f"{server}/info/{dataset_id}/index.json"
-        resp = requests.get(url)
+        resp = get_session().get(url, timeout=HTTP_TIMEOUT)
         resp.raise_for_status()
-        metadata: dict = {"variables": {}}
-        for rowtype, varname, attrname, dtype, value in resp.json()["table"]["rows"]:
+        # The table is only a few hundred rows, far too small for a DataFrame
+        # to beat a plain loop over the rows.
+        variables: dict = {}
+        metadata: dict = {"variables": variables}
+        rows = json_loads(resp.content)["table"]["rows"]
+        for rowtype, varname, attrname, dtype, value in rows:
             if rowtype != "attribute":
                 continue
             try:
@@ -242,9 +300,7 @@ class TableDAPReader(ERDDAPReader):
             if varname == "NC_GLOBAL":
                 metadata[attrname] = value
             else:
-                if varname not in metadata["variables"]:
-                    metadata["variables"][varname] = {}
-                metadata["variables"][varname][attrname] = value
+                variables.setdefault(varname, {})[attrname] = value
         return metadata
 
     def _parse_metadata_value(
@@ -357,6 +413,5 @@ class GridDAPReader(ERDDAPReader):
         # _NCProperties is an internal property which xarray does not yet deal
         # with specially, so we remove it here to prevent it from causing
         # problems for clients.
-        if "_NCProperties" in ds.attrs:
-            del ds.attrs["_NCProperties"]
+        ds.attrs.pop("_NCProperties", None)
         return ds
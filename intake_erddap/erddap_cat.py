@@ -1,10 +1,12 @@
 """Catalog implementation for intake-erddap."""
 
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import datetime
 from logging import getLogger
 from typing import (
     Dict,
+    Iterator,
     List,
     Mapping,
     MutableMapping,
@@ -23,7 +25,7 @@ from erddapy import ERDDAP
 from intake.readers.entry import Catalog, DataDescription
 from intake.readers.readers import BaseReader
 
-from intake_erddap.cache import CacheStore
+from intake_erddap.cache import CSV_ENGINE, CacheStore
 
 from . import utils
 from .utils import match_key_to_category
@@ -31,6 +33,23 @@ from .utils import match_key_to_category
 
 log = getLogger("intake-erddap")
 
+# Upper bound on the searches sent to an ERDDAP server at the same time.
+_MAX_SEARCH_WORKERS = 8
+
+# Search keys which get one search URL per value, in this order.
+_PER_VALUE_SEARCH_KEYS = ("standard_name", "variableName", "search_for")
+
+# Search keys which must be given together or not at all.
+_SEARCH_KEY_GROUPS = (
+    frozenset({"min_lon", "max_lon", "min_lat", "max_lat"}),
+    frozenset({"min_time", "max_time"}),
+)
+
+
+def _is_redundant(dataset_id: str) -> bool:
+    """Return True for datasets which only repeat other datasets' data."""
+    return dataset_id == "allDatasets" or dataset_id.startswith("ism-")
+
 
 class ERDDAPCatalogReader(BaseReader):
     """
@@ -109,11 +128,16 @@ class ERDDAPCatalogReader(BaseReader):
         each individual query made to ERDDAP. This is equivalent to a logical
         AND of the results. If the value is ``"union"`` then the results will be
         the union of each resulting dataset. This is equivalent to a logical OR.
+    max_results : int, optional
+        Keep at most this many datasets in the catalog. For a union, no more
+        search results are read once this many datasets have been found.
     open_kwargs : dict, optional
         Keyword arguments to pass to the `open` method of the ERDDAP Reader,
         e.g. pandas read_csv. Response is an optional keyword argument that will
         be used by ERDDAPY to determine the response format. Default is "csvp" and
         for TableDAP Readers, "csv" and "csv0" are reasonable choices too.
+        {"engine": "pyarrow"} parses large downloads faster, but infers other
+        column types than the default engine.
     mask_failed_qartod : bool, False
         WARNING ALPHA FEATURE. If True and `*_qc_agg` columns associated with
         data columns are available, data values associated with QARTOD flags
@@ -159,6 +183,7 @@ class ERDDAPCatalogReader(BaseReader):
         metadata: dict = None,
         variables: list = None,
         query_type: str = "union",
+        max_results: Optional[int] = None,
         cache_period: Optional[Union[int, float]] = 500,
         open_kwargs: dict = None,
         mask_failed_qartod: bool = False,
@@ -166,6 +191,14 @@ class ERDDAPCatalogReader(BaseReader):
         cache_kwargs: Optional[dict] = None,
         **kwargs,
     ):
+        # Validate before building anything so bad input fails fast.
+        if kwargs_search is not None:
+            for group in _SEARCH_KEY_GROUPS:
+                given = group.intersection(kwargs_search)
+                if given and given != group:
+                    raise ValueError(
+                        f"If any of {sorted(group)} are input, they all must be input."
+                    )
         if server.endswith("/"):
             server = server[:-1]
         self._erddap_client = erddap_client or ERDDAP
@@ -176,9 +209,12 @@ class ERDDAPCatalogReader(BaseReader):
         self._xarray_kwargs = xarray_kwargs
         self._dataset_metadata: Optional[Mapping[str, dict]] = None
         self._query_type = query_type
+        self._max_results = max_results
         self.server = server
         self.search_url = None
-        self.cache_store = CacheStore(cache_period=cache_period)
+        self.cache_store = CacheStore(
+            http_client=utils.get_session(), cache_period=cache_period
+        )
         self.open_kwargs = open_kwargs or {}
         self._mask_failed_qartod = mask_failed_qartod
         self._dropna = dropna
@@ -190,19 +226,7 @@ class ERDDAPCatalogReader(BaseReader):
         chunks = chunks or {}
         xarray_kwargs = xarray_kwargs or {}
 
-        if kwargs_search is not None:
-            checks = [
-                ["min_lon", "max_lon", "min_lat", "max_lat"],
-                ["min_time", "max_time"],
-            ]
-            for check in checks:
-                if any(key in kwargs_search for key in check) and not all(
-                    key in kwargs_search for key in check
-                ):
-                    raise ValueError(
-                        f"If any of {check} are input, they all must be input."
-                    )
-        else:
+        if kwargs_search is None:
             kwargs_search = {}
         # Use deepcopy so we don't mangle objects passed in from clients
         self.kwargs_search = deepcopy(kwargs_search)
@@ -275,27 +299,19 @@ class ERDDAPCatalogReader(BaseReader):
 
     def _load_df(self) -> pd.DataFrame:
         frames = []
-        for url in self.get_search_urls():
-            try:
-                df = self.cache_store.read_csv(url)
-            except HTTPError as e:
-                if e.code == 404:
-                    log.warning(f"search {url} returned HTTP 404")
-                    df = pd.DataFrame({"datasetID": []})
-                else:
-                    raise
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 404:
-                    log.warning(f"search {url} returned HTTP 404")
-                    df = pd.DataFrame({"datasetID": []})
-                else:
-                    raise
-            df.rename(columns={"Dataset ID": "datasetID"}, inplace=True)
-            frames.append(df)
+        # A union only needs the dataset IDs, so collect them in first-seen
+        # order rather than concatenating every frame and dropping duplicates.
+        dataset_ids: Dict[str, None] = {}
+        max_results = self._max_results
+        for df in self._read_all_search_results():
+            if self._query_type == "union":
+                dataset_ids.update(dict.fromkeys(df["datasetID"]))
+                if max_results is not None and len(dataset_ids) >= max_results:
+                    break
+            else:
+                frames.append(df)
         if self._query_type == "union":
-            result = pd.concat(frames)
-            result = result.drop_duplicates("datasetID")
-            return result
+            return pd.DataFrame({"datasetID": list(dataset_ids)[:max_results]})
         elif self._query_type == "intersection":
             result = None
             for frame in frames:
@@ -303,10 +319,53 @@ class ERDDAPCatalogReader(BaseReader):
                     result = frame
                 else:
                     result = result.merge(frame, how="inner", on="datasetID")
+            if result is not None and max_results is not None:
+                result = result.head(max_results)
             return result
         else:
             raise ValueError(f"_query_type is unexpected value: {self._query_type}")
 
+    def _read_all_search_results(self) -> Iterator[pd.DataFrame]:
+        """Yield the results of every distinct search, in search order.
+
+        The searches are independent requests, so they are made concurrently.
+        Searches that haven't started yet are cancelled if the caller stops
+        early.
+        """
+        urls = list(dict.fromkeys(self.iter_search_urls()))
+        if len(urls) < 2:
+            yield from map(self._read_search_results, urls)
+            return
+        with ThreadPoolExecutor(
+            max_workers=min(len(urls), _MAX_SEARCH_WORKERS)
+        ) as executor:
+            yield from executor.map(self._read_search_results, urls)
+
+    def _read_search_results(self, url: str) -> pd.DataFrame:
+        """Return the results of a single search, empty if nothing matched."""
+        try:
+            # Only the IDs are used, so their dtype never reaches users and the
+            # fastest engine is safe here.
+            df = self.cache_store.read_csv(
+                url, pandas_kwargs={"usecols": ["Dataset ID"], "engine": CSV_ENGINE}
+            )
+        except HTTPError as e:
+            if e.code == 404:
+                log.warning(f"search {url} returned HTTP 404")
+                df = pd.DataFrame({"datasetID": []})
+            else:
+                raise
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 404:
+                log.warning(f"search {url} returned HTTP 404")
+                df = pd.DataFrame({"datasetID": []})
+            else:
+                raise
+        df = df.rename(columns={"Dataset ID": "datasetID"})
+        # Drop the redundant datasets here so they don't count toward
+        # max_results.
+        return df.loc[[not _is_redundant(dataset_id) for dataset_id in df["datasetID"]]]
+
     def _load_metadata(self) -> Mapping[str, dict]:
         """Returns all of the dataset metadata available from allDatasets API."""
         if self._dataset_metadata is None:
@@ -317,8 +376,11 @@ class ERDDAPCatalogReader(BaseReader):
 
     def get_search_urls(self) -> List[str]:
         """Return the search URLs used in generating the catalog."""
+        return list(self.iter_search_urls())
+
+    def iter_search_urls(self) -> Iterator[str]:
+        """Yield the search URLs used in generating the catalog."""
         e = self.get_client()
-        urls = []
 
         # cases:
         # - ks.standard_name is a list
@@ -326,104 +388,31 @@ class ERDDAPCatalogReader(BaseReader):
         # - both are lists
         # Generalize approach: if either are defined, set to list and iterate
 
-        if not any(
-            [
-                i in self.kwargs_search
-                for i in ("standard_name", "variableName", "search_for")
-            ]
-        ):
-            search_url = e.get_search_url(
+        if not any(key in self.kwargs_search for key in _PER_VALUE_SEARCH_KEYS):
+            yield e.get_search_url(
                 response="csv",
                 **self.kwargs_search,
                 items_per_page=100000,
             )
-            return [search_url]
-
-        if "standard_name" in self.kwargs_search:
-            urls.extend(
-                self._get_standard_name_search_urls(
-                    utils.as_a_list(self.kwargs_search["standard_name"])
-                )
-            )
-        if "variableName" in self.kwargs_search:
-            urls.extend(
-                self._get_variable_name_search_urls(
-                    utils.as_a_list(self.kwargs_search["variableName"])
+            return
+
+        # Every search shares the remaining parameters, so split them out once
+        # and only vary the one key per URL.
+        params = {
+            key: value
+            for key, value in self.kwargs_search.items()
+            if key not in _PER_VALUE_SEARCH_KEYS
+        }
+        for key in _PER_VALUE_SEARCH_KEYS:
+            if key not in self.kwargs_search:
+                continue
+            for value in utils.as_a_list(self.kwargs_search[key]):
+                yield e.get_search_url(
+                    response="csv",
+                    **params,
+                    **{key: value},
+                    items_per_page=100000,
                 )
-            )
-        if "search_for" in self.kwargs_search:
-            urls.extend(
-                self._get_search_for_search_urls(
-                    utils.as_a_list(self.kwargs_search["search_for"])
-                )
-            )
-
-        return urls
-
-    def _get_standard_name_search_urls(self, standard_names: List[str]) -> List[str]:
-        """Return the search urls for each standard_name."""
-        e = self.get_client()
-        urls = []
-        # mypy is annoying sometimes.
-        assert isinstance(self.kwargs_search, dict)
-
-        for standard_name in standard_names:
-            params = self.kwargs_search.copy()
-            params.pop("variableName", None)
-            params.pop("search_for", None)
-            params["standard_name"] = standard_name
-
-            search_url = e.get_search_url(
-                response="csv",
-                **params,
-                items_per_page=100000,
-            )
-            urls.append(search_url)
-        return urls
-
-    def _get_variable_name_search_urls(self, variable_names: List[str]) -> List[str]:
-        """Return the search urls for each variable name."""
-        e = self.get_client()
-        urls = []
-        # mypy is annoying sometimes.
-        assert isinstance(self.kwargs_search, dict)
-
-        for variable_name in variable_names:
-            params = self.kwargs_search.copy()
-            params.pop("standard_name", None)
-            params.pop("search_for", None)
-            params["variableName"] = variable_name
-
-            search_url = e.get_search_url(
-                response="csv",
-                **params,
-                items_per_page=100000,
-            )
-            urls.append(search_url)
-        return urls
-
-    def _get_search_for_search_urls(self, search_for: List[str]) -> List[str]:
-        """Return the search urls for each search query."""
-        e = self.get_client()
-        urls = []
-        # mypy is annoying sometimes.
-        assert isinstance(self.kwargs_search, dict)
-
-        for query in search_for:
-            params = self.kwargs_search.copy()
-            params.pop("standard_name", None)
-            params.pop("variableName", None)
-            # query is passed directly in method invocation below
-            params.pop("search_for", None)
-
-            search_url = e.get_search_url(
-                response="csv",
-                search_for=query,
-                **params,
-                items_per_page=100000,
-            )
-            urls.append(search_url)
-        return urls
 
     def get_client(self) -> ERDDAP:
         """Return an initialized ERDDAP Client."""
@@ -435,58 +424,57 @@ class ERDDAPCatalogReader(BaseReader):
     def read(self):
         dataidkey = "datasetID"
         e = self.get_client()
-        df = self._load_df()
-        all_metadata = self._load_metadata()
+        # The allDatasets metadata query doesn't depend on the search results,
+        # so run it in the background while the searches are fetched.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            metadata_future = executor.submit(self._load_metadata)
+            df = self._load_df()
+            all_metadata = metadata_future.result()
 
         self._entries = {}
 
-        # Remove datasets that are redundant
-        if len(df) > 0:
-            df = df[
-                (~df["datasetID"].str.startswith("ism-"))
-                * (df["datasetID"] != "allDatasets")
-            ]
+        # Everything but the dataset ID is shared by every entry, so work it
+        # out once up front.
+        if self._protocol == "tabledap":
+            datatype = "intake_erddap.erddap:TableDAPReader"
+            protocol_args = {
+                "mask_failed_qartod": self._mask_failed_qartod,
+                "dropna": self._dropna,
+                "cache_kwargs": self._cache_kwargs,
+            }
+        elif self._protocol == "griddap":
+            datatype = "intake_erddap.erddap:GridDAPReader"
+            protocol_args = {
+                "chunks": self._chunks,
+                "xarray_kwargs": self._xarray_kwargs,
+            }
+        else:
+            raise ValueError(f"Unsupported protocol: {self._protocol}")
+        base_args = {
+            "server": self.server,
+            "variables": self.variables,
+            "protocol": self._protocol,
+            "open_kwargs": self.open_kwargs,
+            **protocol_args,
+        }
+
+        # no equivalent for griddap, though maybe it works the same?
+        constraints = self._get_tabledap_constraints()
 
         entries, aliases = {}, {}
-        for index, row in df.iterrows():
-            dataset_id = row[dataidkey]
+        # Only the IDs are needed, so loop over them as plain strings.
+        for dataset_id in df[dataidkey].tolist():
             metadata = all_metadata.get(dataset_id, {})
 
-            args = {
-                "server": self.server,
-                "dataset_id": dataset_id,
-                "variables": self.variables,
-                "protocol": self._protocol,
-                "constraints": {},
-                "open_kwargs": self.open_kwargs,
-            }
-            if self._protocol == "tabledap":
-                args.update(
-                    {
-                        "mask_failed_qartod": self._mask_failed_qartod,
-                        "dropna": self._dropna,
-                        "cache_kwargs": self._cache_kwargs,
-                    }
-                )
-                args["constraints"].update(self._get_tabledap_constraints())
-                datatype = "intake_erddap.erddap:TableDAPReader"
-            elif self._protocol == "griddap":
-                args.update(
-                    {
-                        "chunks": self._chunks,
-                        "xarray_kwargs": self._xarray_kwargs,
-                    }
-                )
-                # no equivalent for griddap, though maybe it works the same?
-                args["constraints"].update(self._get_tabledap_constraints())
-                datatype = "intake_erddap.erddap:GridDAPReader"
-            else:
-                raise ValueError(f"Unsupported protocol: {self._protocol}")
-
             metadata["info_url"] = e.get_info_url(response="csv", dataset_id=dataset_id)
             entries[dataset_id] = DataDescription(
                 datatype,
-                kwargs={"dataset_id": dataset_id, **args},
+                kwargs={
+                    "dataset_id": dataset_id,
+                    # Each entry gets its own copy to change.
+                    "constraints": dict(constraints),
+                    **base_args,
+                },
                 metadata=metadata,
             )
             aliases[dataset_id] = dataset_id
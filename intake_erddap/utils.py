@@ -2,21 +2,81 @@
 # -*- coding: utf-8 -*-
 """Utility functions."""
 
+import os
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
 from logging import getLogger
-from typing import Any, Dict, List, Mapping, Optional
-from urllib.parse import quote_plus, urlencode
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from urllib.parse import quote, urlencode, urlsplit, urlunsplit
 
-import cf_pandas as cfp
 import numpy as np
 import pandas as pd
+import regex
+import requests
 
 from pandas import DataFrame
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from intake_erddap.cache import CacheStore
+from intake_erddap.cache import CSV_ENGINE, CacheStore, json_loads
 
 
 log = getLogger("intake-erddap")
 
+# Converting columns on a thread pool only pays off when threads can run
+# Python code in parallel, i.e. on free-threaded builds, and the table is
+# large enough to cover the cost of the pool.
+_GIL_ENABLED = getattr(sys, "_is_gil_enabled", lambda: True)()
+_PARALLEL_PARSE_MIN_ROWS = 10_000
+
+# Connections kept open per host by the shared HTTP session.
+_HTTP_POOL_SIZE = 16
+# Connection failures are retried a few times with a short backoff.
+_HTTP_RETRIES = Retry(total=3, backoff_factor=0.2)
+# Seconds to wait on ERDDAP before giving up on a request.
+HTTP_TIMEOUT = 30
+
+# The allDatasets variables that catalog metadata is built from.
+_ALLDATASETS_FIELDS = (
+    "datasetID",
+    "institution",
+    "title",
+    "summary",
+    "minLongitude",
+    "maxLongitude",
+    "minLatitude",
+    "maxLatitude",
+    "minTime",
+    "maxTime",
+    "griddap",
+    "tabledap",
+)
+_ALLDATASETS_QUERY = ",".join(_ALLDATASETS_FIELDS)
+
+# Search constraints this package accepts and the allDatasets constraint each
+# maps to. A dataset overlaps the search when its range overlaps the bounds.
+_CONSTRAINT_MAP = {
+    "max_time": "minTime<",
+    "min_time": "maxTime>",
+    "min_lon": "maxLongitude>",
+    "max_lon": "minLongitude<",
+    "min_lat": "maxLatitude>",
+    "max_lat": "minLatitude<",
+}
+
 
 def return_category_options(
     server: str,
@@ -42,11 +102,57 @@ def return_category_options(
         Column "Category" contains all options for selected category on server. Column "URL" contains
         the link for search results for searching for a given category value.
     """
-
-    url = f"{server}/categorize/{category}/index.csv?page=1&itemsPerPage=100000"
+    url = _category_url(server, category)
     if cache_store is not None:
         return cache_store.read_csv(url)
-    return pd.read_csv(url)
+    return _read_csv_url(url, {})
+
+
+def return_category_values(
+    server: str,
+    category: str = "standard_name",
+    cache_store: Optional[CacheStore] = None,
+) -> np.ndarray:
+    """Return the category values available on an ERDDAP server.
+
+    Unlike ``return_category_options``, only the "Category" column of the
+    response is parsed.
+
+    Parameters
+    ----------
+    server : str
+        ERDDAP server address, for example: "https://erddap.sensors.ioos.us/erddap"
+    category : str, optional
+        ERDDAP category for filtering results. Default is "standard_name" but another good option is
+        "variableName".
+    cache_store : CacheStore
+        The cache store to use for caching responses. If one is provided it will
+        be used instead of making the requests directly.
+
+    Returns
+    -------
+    np.ndarray
+        All options for selected category on server.
+    """
+    url = _category_url(server, category)
+    pandas_kwargs = {"usecols": ["Category"], "engine": CSV_ENGINE}
+    if cache_store is not None:
+        df = cache_store.read_csv(url, pandas_kwargs=pandas_kwargs)
+    else:
+        df = _read_csv_url(url, pandas_kwargs)
+    return df["Category"].to_numpy()
+
+
+def _category_url(server: str, category: str) -> str:
+    """Return the URL listing every value of an ERDDAP category."""
+    return f"{server}/categorize/{category}/index.csv?page=1&itemsPerPage=100000"
+
+
+def _read_csv_url(url: str, pandas_kwargs: dict) -> DataFrame:
+    """Download a CSV over the shared session and parse it."""
+    resp = get_session().get(url, timeout=HTTP_TIMEOUT)
+    resp.raise_for_status()
+    return pd.read_csv(BytesIO(resp.content), **pandas_kwargs)
 
 
 def match_key_to_category(
@@ -81,19 +187,55 @@ def match_key_to_category(
         Values from category results that match key, according to the custom criteria.
     """
 
-    df = return_category_options(server, category, cache_store=cache_store)
-    matching_category_value = cfp.match_criteria_key(
-        df["Category"].values, key, criteria=criteria
-    )
+    from cf_pandas.utils import set_up_criteria
+
+    values = return_category_values(server, category, cache_store=cache_store)
+    custom_criteria = set_up_criteria(criteria)
+    if key not in custom_criteria:
+        # key may already be a valid category value
+        return [key] if key in values else []
+
+    # Same matching as cf_pandas.match_criteria_key, which uses the ``regex``
+    # module, but with the patterns compiled once instead of being looked up
+    # again for every value.
+    match = _compile_criteria(tuple(custom_criteria[key].values()))
+    return [value for value in values if match(value)]
 
-    return matching_category_value
+
+@lru_cache(maxsize=128)
+def _compile_criteria(patterns: Tuple[str, ...]) -> Callable[[str], bool]:
+    """Return a function telling whether a value matches any of the patterns.
+
+    Each pattern is compiled on its own. Joining them into one alternation
+    would renumber their groups and break backreferences such as ``\\1``.
+    """
+    compiled = [regex.compile(pattern) for pattern in patterns]
+    return lambda value: any(pattern.match(value) for pattern in compiled)
 
 
 def as_a_list(value: Any) -> list:
-    """Wrap value in a list if it's not already."""
-    if not isinstance(value, list):
-        return [value]
-    return value
+    """Wrap value in a list if it's not already a plain ``list``."""
+    return value if type(value) is list else [value]
+
+
+@lru_cache(maxsize=None)
+def get_session() -> requests.Session:
+    """Return the HTTP session shared by this package's requests to ERDDAP.
+
+    Reusing one session keeps connections to a server open between the
+    searches, category listings and metadata requests a catalog makes, instead
+    of opening a new connection for each. The connection pool is sized for the
+    catalog's concurrent searches.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=_HTTP_POOL_SIZE,
+        pool_maxsize=_HTTP_POOL_SIZE,
+        max_retries=_HTTP_RETRIES,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
 def get_erddap_metadata(
@@ -101,94 +243,240 @@ def get_erddap_metadata(
     constraints: Mapping[str, Any],
     http_client: Any = None,
     cache_store: Optional[CacheStore] = None,
-) -> Mapping[str, dict]:
-    """Return a map for all the dataset metadata."""
-    if http_client is None:
-        import requests
+    as_dataframe: bool = False,
+) -> Union[Mapping[str, dict], DataFrame]:
+    """Return a map for all the dataset metadata.
 
-        http_client = requests
+    With ``as_dataframe`` the metadata is returned as a DataFrame indexed by
+    datasetID instead; see ``parse_erddap_tabledap_response``.
+    """
+    if http_client is None:
+        http_client = get_session()
     constraints_query = map_constraints_to_tabledap(constraints)
-    fields = [
-        "datasetID",
-        "institution",
-        "title",
-        "summary",
-        "minLongitude",
-        "maxLongitude",
-        "minLatitude",
-        "maxLatitude",
-        "minTime",
-        "maxTime",
-        "griddap",
-        "tabledap",
-    ]
-    url = f"{server}/tabledap/allDatasets.json?" + quote_plus(",".join(fields))
+    # ERDDAP reads the commas in the variable list literally, so only the
+    # constraints are percent-encoded.
+    query = _ALLDATASETS_QUERY
     if constraints_query:
-        url += "&" + urlencode(constraints_query)
-    if cache_store:  # pragma: no cover
-        return parse_erddap_tabledap_response(cache_store.read_json(url))
-    resp = http_client.get(url)
-    resp.raise_for_status()
-    return parse_erddap_tabledap_response(resp.json())
+        query += "&" + urlencode(constraints_query, quote_via=quote)
+    scheme, netloc, path, _, _ = urlsplit(server)
+    url = urlunsplit((scheme, netloc, f"{path}/tabledap/allDatasets.json", query, ""))
+    if cache_store is not None:
+        data = cache_store.read_json(url, http_kwargs={"timeout": HTTP_TIMEOUT})
+    else:
+        resp = http_client.get(url, timeout=HTTP_TIMEOUT)
+        resp.raise_for_status()
+        data = json_loads(resp.content)
+    return parse_erddap_tabledap_response(data, as_dataframe=as_dataframe)
 
 
-def parse_erddap_tabledap_response(data: dict) -> Mapping[str, dict]:
-    """Convert table format into key value mapping."""
-    results = {}
-    column_names = data["table"]["columnNames"]
-    dtypes = data["table"]["columnTypes"]
-    for row in data["table"]["rows"]:
-        try:
-            entry = parse_row(column_names, dtypes, row)
-        except TypeError:
-            log.warning("Encountered TypeError while parsing row from ERDDAP.")
-            log.debug(f"{row}")
-        except ValueError:
-            log.warning("Encountered ValueError while parsing row from ERDDAP.")
+def get_erddap_metadata_many(
+    server: str,
+    constraints_list: Sequence[Mapping[str, Any]],
+    http_client: Any = None,
+    cache_store: Optional[CacheStore] = None,
+    max_workers: Optional[int] = None,
+) -> List[Mapping[str, dict]]:
+    """Return the dataset metadata maps for several sets of constraints.
+
+    The allDatasets requests are made concurrently, so the time spent waiting
+    on ERDDAP overlaps instead of adding up. Constraint sets which produce the
+    same query are only requested once; each of them gets its own shallow copy
+    of the result. Results are returned in the same order as
+    ``constraints_list``.
+
+    Parameters
+    ----------
+    server : str
+        ERDDAP server address, for example: "https://erddap.sensors.ioos.us/erddap"
+    constraints_list : sequence of dict
+        One mapping of search constraints per request, as for ``get_erddap_metadata``.
+    http_client : module or object, optional
+        An HTTP client with a ``requests``-like interface.
+    cache_store : CacheStore
+        The cache store to use for caching responses. If one is provided it will
+        be used instead of making the requests directly.
+    max_workers : int, optional
+        Maximum number of concurrent requests. Defaults to one per set of
+        constraints, capped by ``ThreadPoolExecutor``'s own default.
+    """
+    if not constraints_list:
+        return []
+    # Only the constraints that end up in the allDatasets query matter.
+    queries = [
+        tuple(sorted(map_constraints_to_tabledap(constraints).items()))
+        for constraints in constraints_list
+    ]
+    distinct = dict(zip(queries, constraints_list))
+    if max_workers is None:
+        max_workers = min(len(distinct), min(32, (os.cpu_count() or 1) + 4))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(
+            zip(
+                distinct,
+                executor.map(
+                    lambda constraints: get_erddap_metadata(
+                        server,
+                        constraints,
+                        http_client=http_client,
+                        cache_store=cache_store,
+                    ),
+                    distinct.values(),
+                ),
+            )
+        )
+    return [dict(results[query]) for query in queries]
+
+
+def parse_erddap_tabledap_response(
+    data: dict, as_dataframe: bool = False
+) -> Union[Mapping[str, dict], DataFrame]:
+    """Convert table format into key value mapping.
+
+    If ``as_dataframe`` is True, the cleaned table is returned as a DataFrame
+    indexed by datasetID, which skips building a dict for every row.
+    """
+    table = data["table"]
+    column_names = table["columnNames"]
+    # Start from object columns so string values come back untouched.
+    df = pd.DataFrame(table["rows"], columns=column_names, dtype=object)
+    numeric_columns = [
+        (name, dtype)
+        for name, dtype in zip(column_names, table["columnTypes"])
+        if dtype in _CONVERTERS
+    ]
+    raw_columns = [df[name] for name, _ in numeric_columns]
+    dtypes = [dtype for _, dtype in numeric_columns]
+    if not _GIL_ENABLED and len(df) >= _PARALLEL_PARSE_MIN_ROWS:
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            converted = list(executor.map(_to_numeric, raw_columns, dtypes))
+    else:
+        converted = list(map(_to_numeric, raw_columns, dtypes))
+
+    invalid = pd.Series(False, index=df.index)
+    null_ints = pd.Series(False, index=df.index)
+    for (name, dtype), raw, (values, bad) in zip(
+        numeric_columns, raw_columns, converted
+    ):
+        if dtype in ("long", "int"):
+            null_ints |= raw.isna()
+        invalid |= bad
+        df[name] = values
+
+    # One warning per kind of problem rather than per row; large responses
+    # can otherwise flood the log.
+    skipped = df.loc[null_ints & ~invalid, "datasetID"].tolist()
+    if skipped:
+        log.warning(
+            "ERDDAP Returned an invalid null value for an integer. "
+            f"Skipping {len(skipped)} datasets."
+        )
+        log.debug(f"Datasets with null integers: {skipped}")
+    n_invalid = int(invalid.sum())
+    if n_invalid:
+        log.warning(
+            f"Encountered invalid values while parsing {n_invalid} rows from ERDDAP."
+        )
+        for row in df[invalid].itertuples(index=False, name=None):
             log.debug(f"{row}")
-        if entry is not None:
-            results[entry["datasetID"]] = entry
-    return results
+
+    df = df[~(invalid | null_ints)].drop_duplicates("datasetID", keep="last")
+    if as_dataframe:
+        return df.set_index("datasetID")
+    # Build the records from plain Python column lists; this is several times
+    # faster than DataFrame.to_dict, which boxes every cell individually.
+    columns = df.columns.tolist()
+    values = [df[name].tolist() for name in columns]
+    return {
+        dataset_id: dict(zip(columns, row))
+        for dataset_id, row in zip(values[columns.index("datasetID")], zip(*values))
+    }
+
+
+def _to_numeric(raw: pd.Series, dtype: str) -> Tuple[pd.Series, pd.Series]:
+    """Convert a column of ERDDAP values.
+
+    Returns the converted column, with missing or bad values as NA, and a mask
+    of the values that could not be converted.
+    """
+    if dtype in ("long", "int"):
+        values = pd.to_numeric(raw, errors="coerce", dtype_backend="numpy_nullable")
+        if values.dtype.kind == "f":
+            values = values.where(values == values.round()).astype("Int64")
+    else:
+        # Whole numbers in a double column would otherwise come back as int64.
+        values = pd.to_numeric(raw, errors="coerce").astype("float64")
+    # Values the vectorized conversion gave up on, such as "NaN" for a double
+    # or 2.5 for an int, go through the same converter ``parse_row`` uses, so
+    # that they are kept or truncated just as they are row by row.
+    bad = values.isna() & raw.notna()
+    convert = _CONVERTERS[dtype]
+    for index in bad[bad].index:
+        try:
+            values[index] = convert(raw[index])
+        except (TypeError, ValueError):
+            continue
+        bad[index] = False
+    return values, bad
+
+
+# Returned by ``_to_int`` for a null, which ERDDAP shouldn't send for integers.
+_NULL_INTEGER = object()
+
+
+def _to_float(value: Any) -> float:
+    return np.nan if value is None else float(value)
+
+
+def _to_int(value: Any) -> Any:
+    return _NULL_INTEGER if value is None else int(value)
+
+
+def _passthrough(value: Any) -> Any:
+    return value
+
+
+_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "double": _to_float,
+    "float": _to_float,
+    "long": _to_int,
+    "int": _to_int,
+}
+
+
+def compile_converters(dtypes: List[str]) -> List[Callable[[Any], Any]]:
+    """Return the value converter for each ERDDAP column type.
+
+    Build this once per response and pass it to ``parse_row`` so the column
+    types aren't looked up again for every row.
+    """
+    return [_CONVERTERS.get(dtype, _passthrough) for dtype in dtypes]
 
 
 def parse_row(
-    column_names: List[str], dtypes: List[str], row: List[Any]
+    column_names: List[str],
+    dtypes: List[str],
+    row: List[Any],
+    converters: Optional[List[Callable[[Any], Any]]] = None,
 ) -> Optional[Dict[str, Any]]:
     """Parse a row of the ERDDAP Table JSON response."""
+    if converters is None:
+        converters = compile_converters(dtypes)
     entry: Dict[str, Any] = {}
-    for i, key in enumerate(column_names):
-        dtype = dtypes[i]
-        if dtype in ("double", "float"):
-            if row[i] is None:
-                value = np.nan
-            else:
-                value = float(row[i])
-        elif dtype in ("long", "int"):
-            if row[i] is None:
-                log.warning(
-                    f"ERDDAP Returned an invalid null value for an integer. Skipping dataset {row[0]}"
-                )
-                return None
-            value = int(row[i])
-        else:
-            value = row[i]
+    for key, convert, raw in zip(column_names, converters, row):
+        value = convert(raw)
+        if value is _NULL_INTEGER:
+            log.warning(
+                f"ERDDAP Returned an invalid null value for an integer. Skipping dataset {row[0]}"
+            )
+            return None
         entry[key] = value
     return entry
 
 
 def map_constraints_to_tabledap(constraints: Mapping[str, Any]) -> dict:
     """Transform the constraints dict that this package accepts to an ERDDAP query dict."""
-    constraints_query = {}
-    if "max_time" in constraints:
-        constraints_query["minTime<"] = constraints["max_time"]
-    if "min_time" in constraints:
-        constraints_query["maxTime>"] = constraints["min_time"]
-    if "min_lon" in constraints:
-        constraints_query["maxLongitude>"] = constraints["min_lon"]
-    if "max_lon" in constraints:
-        constraints_query["minLongitude<"] = constraints["max_lon"]
-    if "min_lat" in constraints:
-        constraints_query["maxLatitude>"] = constraints["min_lat"]
-    if "max_lat" in constraints:
-        constraints_query["minLatitude<"] = constraints["max_lat"]
-    return constraints_query
+    return {
+        query: constraints[key]
+        for key, query in _CONSTRAINT_MAP.items()
+        if key in constraints
+    }
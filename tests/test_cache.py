@@ -33,7 +33,7 @@ def test_cache_file(user_cache_dir_mock, tempdir):
     filepath = store.cache_file(url)
     assert filepath.parent == Path(tempdir)
     sha = cache.CacheStore.hash_url(url)
-    assert filepath.name == f"{sha}.gz"
+    assert filepath.name == f"{sha}{cache.CACHE_SUFFIX}"
 
 
 # @mock.patch("requests.get")
@@ -60,13 +60,13 @@ def test_cache_file(user_cache_dir_mock, tempdir):
 def test_clearing_cache(user_cache_dir_mock, http_get_mock, tempdir):
     user_cache_dir_mock.return_value = tempdir
     resp = mock.Mock()
-    resp.content = b"blahblah"
+    resp.iter_content.return_value = [b"blahblah"]
     http_get_mock.return_value = resp
     url = "http://kevinbacon.invalid/erddap/advanced?blahbah"
     store = cache.CacheStore()
     store.cache_response(url)
-    sha = store.hash_url(url)
-    target = Path(tempdir) / f"{sha}.gz"
+    assert http_get_mock.call_args.kwargs["stream"] is True
+    target = store.cache_file(url)
 
     store.clear_cache()
     assert not target.exists()
@@ -101,13 +101,13 @@ def test_cache_read_csv(user_cache_dir_mock, http_get_mock, tempdir):
     user_cache_dir_mock.return_value = tempdir
     resp = mock.Mock()
     http_get_mock.return_value = resp
-    resp.content = b"col_a,col_b\n1,blue\n2,red\n"
+    resp.iter_content.return_value = [b"col_a,col_b\n1,blue\n2,red\n"]
     store = cache.CacheStore()
     url = "http://blah.invalid/erddap/search?q=bacon+egg+and+cheese"
     df = store.read_csv(url)
     assert len(df) == 2
     filepath = store.cache_file(url)
-    with gzip.open(filepath, "wb") as f:
+    with cache.open_cache_file(filepath, "wb") as f:
         f.write(b"col_a,col_b\n3,green\n4,yellow\n")
     df = store.read_csv(url)
     assert df["col_a"].tolist() == [3, 4]
@@ -121,19 +121,35 @@ def test_cache_read_csv(user_cache_dir_mock, http_get_mock, tempdir):
     assert df["col_b"].tolist() == ["blue", "red"]
 
 
+@mock.patch("requests.get")
+@mock.patch("appdirs.user_cache_dir")
+def test_cache_read_csv_parses_once(user_cache_dir_mock, http_get_mock, tempdir):
+    user_cache_dir_mock.return_value = tempdir
+    resp = mock.Mock()
+    http_get_mock.return_value = resp
+    resp.iter_content.return_value = [b"col_a,col_b\n1,blue\n2,red\n"]
+    url = "http://blah.invalid/erddap/search?q=parse+once"
+    with mock.patch("pandas.read_csv", wraps=pd.read_csv) as read_csv_mock:
+        df = cache.CacheStore().read_csv(url)
+        df["col_a"] = [0, 0]
+        df = cache.CacheStore().read_csv(url)
+        assert read_csv_mock.call_count == 1
+    assert df["col_a"].tolist() == [1, 2]
+
+
 @mock.patch("requests.get")
 @mock.patch("appdirs.user_cache_dir")
 def test_cache_read_json(user_cache_dir_mock, http_get_mock, tempdir):
     user_cache_dir_mock.return_value = tempdir
     resp = mock.Mock()
     http_get_mock.return_value = resp
-    resp.content = b'{"key":"value", "example": "blah"}'
+    resp.iter_content.return_value = [b'{"key":"value", "example": "blah"}']
     store = cache.CacheStore()
     url = "http://blah.invalid/erddap/search?q=bacon+egg+and+cheese"
     data = store.read_json(url)
     assert data == {"key": "value", "example": "blah"}
     filepath = store.cache_file(url)
-    with gzip.open(filepath, "wb") as f:
+    with cache.open_cache_file(filepath, "wb") as f:
         f.write(b'{"different": "is different"}')
     data = store.read_json(url)
     assert data["different"] == "is different"
@@ -145,6 +161,23 @@ def test_cache_read_json(user_cache_dir_mock, http_get_mock, tempdir):
     assert data == {"key": "value", "example": "blah"}
 
 
+@pytest.mark.skipif(cache.zstandard is None, reason="zstandard is not installed")
+@mock.patch("requests.get")
+@mock.patch("appdirs.user_cache_dir")
+def test_cache_read_legacy_gzip(user_cache_dir_mock, http_get_mock, tempdir):
+    user_cache_dir_mock.return_value = tempdir
+    store = cache.CacheStore()
+    url = "http://blah.invalid/erddap/search?q=bacon+egg+and+cheese"
+    legacy = store.cache_file(url).with_suffix(".gz")
+    with gzip.open(legacy, "wb") as f:
+        f.write(b'{"legacy": "gzip"}')
+    assert store.read_json(url) == {"legacy": "gzip"}
+    assert not http_get_mock.called
+
+    store.clear_cache()
+    assert not legacy.exists()
+
+
 @mock.patch("requests.get")
 @mock.patch("appdirs.user_cache_dir")
 def test_cache_disabled(user_cache_dir_mock, http_get_mock, tempdir):
@@ -152,7 +185,7 @@ def test_cache_disabled(user_cache_dir_mock, http_get_mock, tempdir):
     user_cache_dir_mock.return_value = tempdir
     resp = mock.Mock()
     http_get_mock.return_value = resp
-    resp.json.return_value = {"test": "test"}
+    resp.content = b'{"test": "test"}'
     store = cache.CacheStore(cache_period=0)
     url = "http://blah.invalid/erddap/search?q=bacon+egg+and+cheese"
     data = store.read_json(url)
@@ -177,6 +210,13 @@ def test_cache_disabled_csv(user_cache_dir_mock, csv_mock, tempdir):
     assert len(cache_contents) == 0
     assert not store.cache_enabled()
     csv_mock.assert_called()
+    assert csv_mock.call_args.kwargs["storage_options"] == {"Accept-Encoding": "gzip"}
+    # The C engine is the default, so the dtypes users get don't change
+    assert "engine" not in csv_mock.call_args.kwargs
+    assert csv_mock.call_args.kwargs["low_memory"] is False
+
+    store.read_csv(url, pandas_kwargs={"engine": "pyarrow"})
+    assert "low_memory" not in csv_mock.call_args.kwargs
 
 
 @mock.patch("requests.get")
@@ -200,3 +240,24 @@ def test_cache_on_http_error(user_cache_dir_mock, http_get_mock, tempdir):
     with pytest.raises(HTTPError):
         store.read_csv(url)
     assert http_get_mock.call_count == 2
+
+
+@mock.patch("requests.get")
+@mock.patch("appdirs.user_cache_dir")
+def test_cache_interrupted_download(user_cache_dir_mock, http_get_mock, tempdir):
+    user_cache_dir_mock.return_value = tempdir
+    resp = mock.Mock()
+    http_get_mock.return_value = resp
+
+    def iter_content(chunk_size):
+        yield b"col_a,col_b\n"
+        raise ConnectionError("connection reset")
+
+    resp.iter_content.side_effect = iter_content
+    url = "http://blah.invalid/erddap/search?q=interrupted"
+    store = cache.CacheStore()
+    with pytest.raises(ConnectionError):
+        store.read_csv(url)
+    # Neither the cache file nor the partial download is left behind
+    assert os.listdir(tempdir) == []
+    resp.close.assert_called_once()
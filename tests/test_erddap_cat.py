@@ -1,9 +1,6 @@
 #!/usr/bin/env pytest
 """Unit tests."""
-import os
-
 from datetime import datetime
-from tempfile import mkstemp
 from unittest import mock
 from urllib.error import HTTPError
 from urllib.parse import parse_qsl, urlparse
@@ -15,8 +12,7 @@ import pandas as pd
 import pytest
 import requests
 
-from erddapy import ERDDAP
-
+from intake_erddap.cache import CSV_ENGINE
 from intake_erddap.erddap import GridDAPReader, TableDAPReader
 from intake_erddap.erddap_cat import ERDDAPCatalogReader
 
@@ -24,7 +20,11 @@ from intake_erddap.erddap_cat import ERDDAPCatalogReader
 SERVER_URL = "http://erddap.invalid/erddap"
 
 
-@pytest.fixture
+# The search result frames below are built once per session and shared between
+# tests; the catalog only reads them.
+
+
+@pytest.fixture(scope="session")
 def single_dataset_catalog() -> pd.DataFrame:
     """Fixture returns a dataframe with a single dataset ID."""
     df = pd.DataFrame()
@@ -32,42 +32,111 @@ def single_dataset_catalog() -> pd.DataFrame:
     return df
 
 
+@pytest.fixture(scope="session")
+def category_results() -> pd.DataFrame:
+    """Fixture returns a category listing with a single standard name."""
+    df = pd.DataFrame()
+    df["Category"] = ["sea_water_temperature"]
+    df["URL"] = ["http://blah.invalid"]
+    return df
+
+
+@pytest.fixture(scope="session")
+def search_results() -> pd.DataFrame:
+    """Fixture returns search results as ERDDAP labels them."""
+    df = pd.DataFrame()
+    df["Dataset ID"] = ["testID"]
+    return df
+
+
+@pytest.fixture(scope="session")
+def eight_datasets() -> pd.DataFrame:
+    """Fixture returns a dataframe of eight datasets."""
+    return pd.DataFrame(
+        {
+            "datasetID": [f"ab00{i}" for i in range(1, 9)],
+            "title": ["Example dataset"] * 8,
+        }
+    )
+
+
+@pytest.fixture(scope="session")
+def catalog_factory():
+    """Return catalog readers shared between tests built with the same arguments.
+
+    Only for tests that call ``read`` or inspect the reader without changing it.
+    A reader keeps the allDatasets metadata from its first ``read``, so tests
+    that depend on that metadata should build their own.
+    """
+    catalogs = {}
+
+    def make(**kwargs) -> ERDDAPCatalogReader:
+        key = repr(sorted(kwargs.items()))
+        if key not in catalogs:
+            catalogs[key] = ERDDAPCatalogReader(**kwargs)
+        return catalogs[key]
+
+    return make
+
+
+@pytest.fixture
+def cf_criteria():
+    """Set cf-pandas custom criteria for one test and restore them afterwards."""
+    previous = cf_pandas.options.OPTIONS["custom_criteria"]
+    yield lambda criteria: cf_pandas.set_options(custom_criteria=criteria)
+    cf_pandas.set_options(custom_criteria=previous)
+
+
+@pytest.fixture(autouse=True)
+def mock_read_csv(monkeypatch, request, single_dataset_catalog):
+    """Keep the unit tests off the network.
+
+    Searches return ``single_dataset_catalog`` and the allDatasets metadata is
+    empty unless a test overrides them through the returned mock or
+    ``mock_get_erddap_metadata``.
+    """
+    if "integration" in request.keywords:
+        return None
+    read_csv = mock.MagicMock(return_value=single_dataset_catalog)
+    monkeypatch.setattr("intake_erddap.cache.CacheStore.read_csv", read_csv)
+    return read_csv
+
+
+@pytest.fixture(autouse=True)
+def mock_get_erddap_metadata(monkeypatch, request):
+    """Return empty allDatasets metadata for every unit test catalog."""
+    if "integration" in request.keywords:
+        return None
+    get_erddap_metadata = mock.MagicMock(return_value={})
+    monkeypatch.setattr("intake_erddap.utils.get_erddap_metadata", get_erddap_metadata)
+    return get_erddap_metadata
+
+
 def test_nothing():
     """This test exists to ensure that at least one test works."""
     pass
 
 
+@pytest.fixture(scope="session")
+def catalog_dir(tmp_path_factory):
+    """Directory shared by every test that writes a catalog file."""
+    return tmp_path_factory.mktemp("catalogs")
+
+
 @pytest.fixture
-def temporary_catalog():
-    fd, path = mkstemp(suffix=".yml")
-    os.close(fd)
-    try:
-        yield path
-    finally:
-        if os.path.exists(path):
-            os.unlink(path)
-
-
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_erddap_catalog(mock_read_csv, load_metadata_mock):
+def temporary_catalog(catalog_dir, request) -> str:
+    """Path for a catalog file, unique to the requesting test."""
+    return str(catalog_dir / f"{request.node.name}.yml")
+
+
+def test_erddap_catalog(catalog_factory):
     """Test basic catalog API."""
-    load_metadata_mock.return_value = {}
-    results = pd.DataFrame()
-    results["datasetID"] = ["abc123"]
-    mock_read_csv.return_value = results
-    cat = ERDDAPCatalogReader(server=SERVER_URL).read()
+    cat = catalog_factory(server=SERVER_URL).read()
     assert list(cat) == ["abc123"]
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_erddap_catalog_searching(mock_read_csv, load_metadata_mock):
+def test_erddap_catalog_searching():
     """Test catalog with search parameters."""
-    load_metadata_mock.return_value = {}
-    results = pd.DataFrame()
-    results["datasetID"] = ["abc123"]
-    mock_read_csv.return_value = results
     kw = {
         "min_lon": -180,
         "max_lon": -156,
@@ -80,23 +149,17 @@ def test_erddap_catalog_searching(mock_read_csv, load_metadata_mock):
     assert list(cat) == ["abc123"]
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_erddap_catalog_searching_variable(mock_read_csv, load_metadata_mock):
-    load_metadata_mock.return_value = {}
-    df1 = pd.DataFrame()
-    df1["Category"] = ["sea_water_temperature"]
-    df1["URL"] = ["http://blah.invalid"]
-    df2 = pd.DataFrame()
-    df2["Dataset ID"] = ["testID"]
+def test_erddap_catalog_searching_variable(
+    mock_read_csv, category_results, search_results, cf_criteria
+):
     # pd.read_csv is called twice, so two return results
-    mock_read_csv.side_effect = [df1, df2]
+    mock_read_csv.side_effect = [category_results, search_results]
     criteria = {
         "temp": {
             "standard_name": "sea_water_temperature$",
         },
     }
-    cf_pandas.set_options(custom_criteria=criteria)
+    cf_criteria(criteria)
     kw = {
         "min_lon": -180,
         "max_lon": -156,
@@ -154,60 +217,48 @@ def test_erddap_global_conneection():
     ).read()
 
 
-def test_invalid_kwarg_search():
+@pytest.mark.parametrize("missing", ["min_lat", "min_time"])
+def test_invalid_kwarg_search(missing):
     kw = {
         "min_lon": -180,
         "max_lon": -156,
+        "min_lat": 50,
         "max_lat": 66,
         "min_time": "2021-4-1",
         "max_time": "2021-4-2",
     }
+    del kw[missing]
 
     with pytest.raises(ValueError):
         ERDDAPCatalogReader(server=SERVER_URL, kwargs_search=kw).read()
 
-    kw = {
-        "min_lon": -180,
-        "max_lon": -156,
-        "min_lat": 50,
-        "max_lat": 66,
-        "max_time": "2021-4-2",
-    }
 
-    with pytest.raises(ValueError):
-        ERDDAPCatalogReader(server=SERVER_URL, kwargs_search=kw).read()
+class StubERDDAP:
+    """Stands in for the erddapy client class; records how it was built."""
 
+    def __init__(self, server):
+        self.server = server
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_uses_di_client(
-    mock_read_csv, load_metadata_mock, single_dataset_catalog
-):
-    load_metadata_mock.return_value = {}
+
+def test_catalog_uses_di_client():
     """Tests that the catalog uses the dependency injection provided client."""
-    mock_read_csv.return_value = single_dataset_catalog
-    mock_erddap_client = mock.create_autospec(ERDDAP)
-    cat = ERDDAPCatalogReader(server=SERVER_URL, erddap_client=mock_erddap_client)
+    cat = ERDDAPCatalogReader(server=SERVER_URL, erddap_client=StubERDDAP)
     client = cat.get_client()
-    assert isinstance(client, mock.NonCallableMagicMock)
+    assert isinstance(client, StubERDDAP)
+    assert client.server == SERVER_URL
+    assert client.dataset_id == "allDatasets"
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_skips_all_datasets_row(mock_read_csv, load_metadata_mock):
-    load_metadata_mock.return_value = {}
+def test_catalog_skips_all_datasets_row(mock_read_csv, catalog_factory):
     """Tests that the catalog results ignore allDatasets special dataset."""
     df = pd.DataFrame()
     df["datasetID"] = ["allDatasets", "abc123"]
     mock_read_csv.return_value = df
-    cat = ERDDAPCatalogReader(server=SERVER_URL).read()
+    cat = catalog_factory(server=SERVER_URL).read()
     assert list(cat) == ["abc123"]
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_params_search(mock_read_csv, load_metadata_mock):
-    load_metadata_mock.return_value = {}
+def test_params_search(mock_read_csv):
     df = pd.DataFrame()
     df["datasetID"] = ["allDatasets", "abc123"]
     mock_read_csv.return_value = df
@@ -233,39 +284,29 @@ def test_params_search(mock_read_csv, load_metadata_mock):
     assert query["standard_name"] == "sea_water_temperature"
 
 
-# @mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-# @mock.patch("intake_erddap.cache.CacheStore.read_csv")
-# def test_constraints_present_in_reader(
-#     mock_read_csv, load_metadata_mock, single_dataset_catalog
-# ):
-#     load_metadata_mock.return_value = {}
-#     mock_read_csv.return_value = single_dataset_catalog
-#     search = {
-#         "min_time": "2022-01-01",
-#         "max_time": "2022-11-07",
-#     }
-#     cat = ERDDAPCatalogReader(server=SERVER_URL, kwargs_search=search)
-#     cat.read()
-#     dataset_id = list(cat)[0]
-#     reader = cat[dataset_id]
-#     assert cat._constraints["time>="] == "2022-01-01"
-#     assert reader._constraints["time<="] == "2022-11-07"
-
-#     cat = ERDDAPCatalogReader(
-#         server=SERVER_URL, kwargs_search=search, use_source_constraints=False
-#     ).read()
-#     dataset_id = list(cat)[0]
-#     reader = cat[dataset_id]
-#     assert len(reader._constraints) == 0
-
-
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_with_griddap(
-    mock_read_csv, load_metadata_mock, single_dataset_catalog
-):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_constraints_present_in_entries(mock_read_csv, eight_datasets):
+    mock_read_csv.return_value = eight_datasets
+    search = {
+        "min_time": "2022-01-01",
+        "max_time": "2022-11-07",
+    }
+    cat = ERDDAPCatalogReader(server=SERVER_URL, kwargs_search=search).read()
+    for dataset_id in ("ab001", "ab008"):
+        assert cat[dataset_id].kwargs["constraints"] == {
+            "time>=": "2022-01-01",
+            "time<=": "2022-11-07",
+        }
+    # Changing one entry's constraints leaves the others alone
+    cat.data["ab001"].kwargs["constraints"]["time>="] = "2022-06-01"
+    assert cat.data["ab008"].kwargs["constraints"]["time>="] == "2022-01-01"
+
+    cat = ERDDAPCatalogReader(
+        server=SERVER_URL, kwargs_search=search, use_source_constraints=False
+    ).read()
+    assert cat["ab001"].kwargs["constraints"] == {}
+
+
+def test_catalog_with_griddap():
     search = {
         "min_time": "2022-01-01",
         "max_time": "2022-11-07",
@@ -278,30 +319,18 @@ def test_catalog_with_griddap(
     assert isinstance(reader, GridDAPReader)
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_with_unsupported_protocol(
-    mock_read_csv, load_metadata_mock, single_dataset_catalog
-):
-    load_metadata_mock.return_value = {}
+def test_catalog_with_unsupported_protocol():
     search = {
         "min_time": "2022-01-01",
         "max_time": "2022-11-07",
     }
-    mock_read_csv.return_value = single_dataset_catalog
     with pytest.raises(ValueError):
         ERDDAPCatalogReader(
             server=SERVER_URL, kwargs_search=search, protocol="fakedap"
         ).read()
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_get_search_urls_by_category(
-    mock_read_csv, load_metadata_mock, single_dataset_catalog
-):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_catalog_get_search_urls_by_category():
     kwargs_search = {
         "standard_name": ["air_pressure", "air_temperature"],
         "variableName": ["temp", "airTemp"],
@@ -312,11 +341,7 @@ def test_catalog_get_search_urls_by_category(
     assert len(search_urls) == 6
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_bbox(mock_read_csv, load_metadata_mock, single_dataset_catalog):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_catalog_bbox():
     catalog = ERDDAPCatalogReader(server=SERVER_URL, bbox=(-120.0, 30.0, -100.0, 48.0))
     assert catalog.kwargs_search["min_lon"] == -120.0
     assert catalog.kwargs_search["max_lon"] == -100.0
@@ -329,13 +354,7 @@ def test_catalog_bbox(mock_read_csv, load_metadata_mock, single_dataset_catalog)
         ERDDAPCatalogReader(server=SERVER_URL, bbox=(0, 0))
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_standard_names_arg(
-    mock_read_csv, load_metadata_mock, single_dataset_catalog
-):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_catalog_standard_names_arg():
     catalog = ERDDAPCatalogReader(
         server=SERVER_URL, standard_names=["air_temperature", "air_pressure"]
     )
@@ -345,13 +364,7 @@ def test_catalog_standard_names_arg(
         ERDDAPCatalogReader(server=SERVER_URL, standard_names="air_temperature")
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_variable_names_arg(
-    mock_read_csv, load_metadata_mock, single_dataset_catalog
-):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_catalog_variable_names_arg():
     catalog = ERDDAPCatalogReader(server=SERVER_URL, variable_names=["airTemp", "Pair"])
     assert catalog.kwargs_search["variableName"] == ["airTemp", "Pair"]
 
@@ -359,11 +372,7 @@ def test_catalog_variable_names_arg(
         ERDDAPCatalogReader(server=SERVER_URL, variable_names="air_temperature")
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_times_arg(mock_read_csv, load_metadata_mock, single_dataset_catalog):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_catalog_times_arg():
     catalog = ERDDAPCatalogReader(
         server=SERVER_URL,
         start_time=datetime(2022, 1, 1),
@@ -381,13 +390,7 @@ def test_catalog_times_arg(mock_read_csv, load_metadata_mock, single_dataset_cat
         ERDDAPCatalogReader(server=SERVER_URL, end_time=np.datetime64("2022-01-01"))
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_search_for_arg(
-    mock_read_csv, load_metadata_mock, single_dataset_catalog
-):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_catalog_search_for_arg():
     catalog = ERDDAPCatalogReader(server=SERVER_URL, search_for=["ioos", "aoos"])
     assert catalog.kwargs_search["search_for"] == ["ioos", "aoos"]
 
@@ -395,13 +398,7 @@ def test_catalog_search_for_arg(
         ERDDAPCatalogReader(server=SERVER_URL, search_for="aoos")
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_query_search_for(
-    mock_read_csv, load_metadata_mock, single_dataset_catalog
-):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_catalog_query_search_for():
     kwargs_search = {
         "search_for": ["air_pressure", "air_temperature"],
     }
@@ -418,29 +415,21 @@ def test_catalog_query_search_for(
     assert query["searchFor"] == "air_temperature"
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_search_returns_404(mock_read_csv, load_metadata_mock):
-    load_metadata_mock.return_value = {}
+def test_search_returns_404(mock_read_csv, catalog_factory):
+    catalog = catalog_factory(server=SERVER_URL)
     mock_read_csv.side_effect = HTTPError(
         code=404, msg="Blah", url=SERVER_URL, hdrs={}, fp=None
     )
-    cat = ERDDAPCatalogReader(server=SERVER_URL).read()
+    cat = catalog.read()
     assert len(cat) == 0
     mock_read_csv.side_effect = HTTPError(
         code=500, msg="Blah", url=SERVER_URL, hdrs={}, fp=None
     )
     with pytest.raises(HTTPError):
-        ERDDAPCatalogReader(server=SERVER_URL).read()
+        catalog.read()
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_saving_catalog(
-    mock_read_csv, load_metadata_mock, single_dataset_catalog, temporary_catalog
-):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_saving_catalog(temporary_catalog):
     cat = ERDDAPCatalogReader(server=SERVER_URL).read()
     cat.to_yaml_file(temporary_catalog)
 
@@ -464,12 +453,7 @@ def test_saving_catalog(
     assert cat.__dict__["data"][dataset_id].__dict__["kwargs"]["server"] == SERVER_URL
 
 
-@mock.patch("intake_erddap.utils.get_erddap_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_loading_metadata(
-    mock_read_csv, mock_get_erddap_metadata, single_dataset_catalog
-):
-    mock_read_csv.return_value = single_dataset_catalog
+def test_loading_metadata(mock_get_erddap_metadata):
     mock_get_erddap_metadata.return_value = {
         "abc123": {"datasetID": "abc123", "institution": "FOMO"}
     }
@@ -478,54 +462,13 @@ def test_loading_metadata(
     assert cat["abc123"].metadata["institution"] == "FOMO"
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_trailing_slash(mock_read_csv, load_metadata_mock, single_dataset_catalog):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_trailing_slash():
     catalog = ERDDAPCatalogReader(server="http://blah.invalid/erddap/")
     assert catalog.server == "http://blah.invalid/erddap"
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_catalog_query_type_intersection(mock_read_csv, load_metadata_mock):
-    data = [
-        {
-            "datasetID": "ab001",
-            "title": "Example dataset",
-        },
-        {
-            "datasetID": "ab002",
-            "title": "Example dataset",
-        },
-        {
-            "datasetID": "ab003",
-            "title": "Example dataset",
-        },
-        {
-            "datasetID": "ab004",
-            "title": "Example dataset",
-        },
-        {
-            "datasetID": "ab005",
-            "title": "Example dataset",
-        },
-        {
-            "datasetID": "ab006",
-            "title": "Example dataset",
-        },
-        {
-            "datasetID": "ab007",
-            "title": "Example dataset",
-        },
-        {
-            "datasetID": "ab008",
-            "title": "Example dataset",
-        },
-    ]
-
-    big_df = pd.DataFrame(data)
+def test_catalog_query_type_intersection(mock_read_csv, eight_datasets):
+    big_df = eight_datasets
     sub_df1 = big_df
     sub_df2 = big_df[:4]
     sub_df3 = big_df[2:7]
@@ -542,11 +485,65 @@ def test_catalog_query_type_intersection(mock_read_csv, load_metadata_mock):
     assert len(search_urls) == 3
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_query_type_invalid(mock_read_csv, load_metadata_mock, single_dataset_catalog):
-    load_metadata_mock.return_value = {}
-    mock_read_csv.return_value = single_dataset_catalog
+def test_catalog_query_type_union(mock_read_csv):
+    # The searches run concurrently, so answer by URL rather than call order.
+    results = {
+        "air_pressure": pd.DataFrame({"datasetID": ["ab001", "ab002"]}),
+        "air_temperature": pd.DataFrame({"Dataset ID": ["ab002", "ab003"]}),
+    }
+    mock_read_csv.side_effect = lambda url, pandas_kwargs: results[
+        dict(parse_qsl(urlparse(url).query))["standard_name"]
+    ]
+    cat = ERDDAPCatalogReader(
+        server=SERVER_URL, standard_names=["air_pressure", "air_temperature"]
+    ).read()
+    assert list(cat) == ["ab001", "ab002", "ab003"]
+
+
+def test_catalog_max_results(mock_read_csv):
+    results = {
+        "air_pressure": pd.DataFrame({"datasetID": ["ab001", "ab002"]}),
+        "air_temperature": pd.DataFrame({"datasetID": ["ab002", "ab003"]}),
+    }
+    mock_read_csv.side_effect = lambda url, pandas_kwargs: results[
+        dict(parse_qsl(urlparse(url).query))["standard_name"]
+    ]
+    standard_names = ["air_pressure", "air_temperature"]
+    cat = ERDDAPCatalogReader(
+        server=SERVER_URL, standard_names=standard_names, max_results=1
+    ).read()
+    assert list(cat) == ["ab001"]
+
+    cat = ERDDAPCatalogReader(
+        server=SERVER_URL,
+        standard_names=standard_names,
+        query_type="intersection",
+        max_results=1,
+    ).read()
+    assert list(cat) == ["ab002"]
+
+
+def test_catalog_max_results_skips_redundant(mock_read_csv):
+    mock_read_csv.return_value = pd.DataFrame(
+        {"datasetID": ["allDatasets", "ism-abc", "ab001", "ab002"]}
+    )
+    cat = ERDDAPCatalogReader(server=SERVER_URL, max_results=1).read()
+    assert list(cat) == ["ab001"]
+    assert mock_read_csv.call_args.kwargs["pandas_kwargs"] == {
+        "usecols": ["Dataset ID"],
+        "engine": CSV_ENGINE,
+    }
+
+
+def test_catalog_skips_repeated_searches(mock_read_csv):
+    cat = ERDDAPCatalogReader(
+        server=SERVER_URL, standard_names=["air_pressure", "air_pressure"]
+    ).read()
+    assert list(cat) == ["abc123"]
+    assert mock_read_csv.call_count == 1
+
+
+def test_query_type_invalid():
     with pytest.raises(ValueError):
         ERDDAPCatalogReader(
             server="http://blah.invalid/erddap/", query_type="blah"
@@ -570,10 +567,7 @@ def test_empty_search_results():
     assert len(cat) == 0
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_empty_catalog(mock_read_csv, load_metadata_mock, single_dataset_catalog):
-    load_metadata_mock.return_value = {}
+def test_empty_catalog(mock_read_csv):
     resp = mock.Mock()
     resp.status_code = 404
     mock_read_csv.side_effect = requests.exceptions.HTTPError(response=resp)
@@ -593,12 +587,7 @@ def test_empty_catalog(mock_read_csv, load_metadata_mock, single_dataset_catalog
         ).read()
 
 
-@mock.patch("intake_erddap.erddap_cat.ERDDAPCatalogReader._load_metadata")
-@mock.patch("intake_erddap.cache.CacheStore.read_csv")
-def test_empty_catalog_with_intersection(
-    mock_read_csv, load_metadata_mock, single_dataset_catalog
-):
-    load_metadata_mock.return_value = {}
+def test_empty_catalog_with_intersection(mock_read_csv):
     resp = mock.Mock()
     resp.status_code = 404
     mock_read_csv.side_effect = requests.exceptions.HTTPError(response=resp)
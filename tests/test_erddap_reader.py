@@ -1,6 +1,7 @@
 #!/usr/bin/env pytest
 # -*- coding: utf-8 -*-
 """Unit tests for the ERDDAP Reader object."""
+import io
 import json
 
 from pathlib import Path
@@ -52,6 +53,12 @@ def fake_grid() -> xr.Dataset:
     return _grid(grid_data)
 
 
+@pytest.fixture(scope="session")
+def tabledap_metadata_json() -> bytes:
+    """Return the raw tabledap info response used by the metadata tests."""
+    return (Path(__file__).parent / "test_data/tabledap_metadata.json").read_bytes()
+
+
 @pytest.fixture
 def fake_dask_grid() -> xr.Dataset:
     """Return a fake grid for testing purposes."""
@@ -81,6 +88,38 @@ def test_erddap_reader_read(mock_to_pandas, mock_get_dataset_metadata):
     reader.close()
 
 
+@mock.patch("intake_erddap.erddap.TableDAPReader._get_dataset_metadata")
+@mock.patch("erddapy.ERDDAP.to_pandas")
+def test_tabledap_reader_dtypes(mock_to_pandas, mock_get_dataset_metadata, tmp_path):
+    """The default parser keeps ERDDAP's ISO times as strings."""
+    csv = tmp_path / "data.csv"
+    csv.write_text(
+        "time (UTC),sea_water_temperature (degree_Celsius),station\n"
+        "2022-10-21T01:00:00Z,13.4,abc123\n"
+        "2022-10-21T02:00:00Z,13.5,abc123\n"
+    )
+    mock_to_pandas.side_effect = lambda requests_kwargs, **kw: pd.read_csv(csv, **kw)
+    mock_get_dataset_metadata.return_value = {"variables": {}}
+
+    reader = TableDAPReader(server="http://erddap.invalid/erddap", dataset_id="abc123")
+    df = reader.read()
+    assert mock_to_pandas.call_args.kwargs == {"requests_kwargs": {"timeout": 60}}
+    assert pd.api.types.is_string_dtype(df["time (UTC)"])
+    assert df["sea_water_temperature (degree_Celsius)"].dtype == np.float64
+    assert pd.api.types.is_string_dtype(df["station"])
+
+    # The pyarrow engine is opt-in through open_kwargs
+    mock_to_pandas.side_effect = None
+    mock_to_pandas.return_value = pd.DataFrame()
+    reader = TableDAPReader(
+        server="http://erddap.invalid/erddap",
+        dataset_id="abc123",
+        open_kwargs={"engine": "pyarrow"},
+    )
+    reader.read()
+    assert mock_to_pandas.call_args.kwargs["engine"] == "pyarrow"
+
+
 @mock.patch("intake_erddap.erddap.TableDAPReader._get_dataset_metadata")
 @mock.patch("erddapy.ERDDAP.to_pandas")
 def test_erddap_reader_read_processing(mock_to_pandas, mock_get_dataset_metadata):
@@ -110,9 +149,70 @@ def test_erddap_reader_read_processing(mock_to_pandas, mock_get_dataset_metadata
     assert len(df) == 1
 
 
-@mock.patch("requests.get")
-def test_tabledap_reader_get_dataset_metadata(mock_get):
-    test_data = Path(__file__).parent / "test_data/tabledap_metadata.json"
+def test_mask_failed_qartod_pairs_columns():
+    """Each data column is masked by its own qc column only."""
+    df = pd.DataFrame(
+        {
+            "temp": [1.0, 2.0, 3.0],
+            "temp_qc_agg": [1, 4, 2],
+            "salt": [30.0, 31.0, 32.0],
+            "salt_qc_agg": [3, 1, 9],
+            "depth": [0.5, 1.0, 1.5],
+        }
+    )
+    reader = TableDAPReader(server="http://erddap.invalid/erddap", dataset_id="abc123")
+    result = reader.run_mask_failed_qartod(df)
+    assert list(result.columns) == ["temp", "salt", "depth"]
+    assert result["temp"].tolist()[::2] == [1.0, 3.0]
+    assert np.isnan(result["temp"][1])
+    assert np.isnan(result["salt"][[0, 2]]).all()
+    assert result["salt"][1] == 31.0
+    assert result["depth"].tolist() == [0.5, 1.0, 1.5]
+
+
+@mock.patch("intake_erddap.erddap.TableDAPReader._get_dataset_metadata")
+@mock.patch("erddapy.ERDDAP.get_download_url")
+@mock.patch("intake_erddap.erddap.get_session")
+def test_erddap_reader_read_in_chunks(
+    get_session_mock, mock_get_download_url, mock_get_dataset_metadata
+):
+    """Tests that QARTOD masking and dropna are applied to each chunk."""
+    csv = (
+        b"time,sea_water_temperature,sea_water_temperature_qc_agg\n"
+        b"2022-10-21T01:00:00Z,13.4,1\n"
+        b"2022-10-21T02:00:00Z,13.4,4\n"
+        b"2022-10-21T03:00:00Z,,2\n"
+        b"2022-10-21T04:00:00Z,13.5,1\n"
+    )
+    mock_get = get_session_mock.return_value.get
+    mock_get.side_effect = lambda url, **kwargs: mock.MagicMock(raw=io.BytesIO(csv))
+    mock_get_download_url.return_value = "http://erddap.invalid/erddap/data.csv"
+    mock_get_dataset_metadata.return_value = {"variables": {}}
+
+    open_kwargs = {"response": "csv"}
+    reader = TableDAPReader(
+        server="http://erddap.invalid/erddap",
+        dataset_id="abc123",
+        mask_failed_qartod=True,
+        dropna=True,
+        chunksize=2,
+        open_kwargs=open_kwargs,
+    )
+    df = reader.read()
+    assert df["sea_water_temperature"].tolist() == [13.4, 13.5]
+    assert df.index.tolist() == [0, 3]
+    assert "sea_water_temperature_qc_agg" not in df.columns
+    assert mock_get.call_args.kwargs["timeout"] == 60
+    # The caller's open_kwargs are left alone, so a second read asks for the
+    # same response format.
+    assert open_kwargs == {"response": "csv"}
+    reader.read()
+    assert mock_get_download_url.call_args.kwargs["response"] == "csv"
+
+
+@mock.patch("intake_erddap.erddap.get_session")
+def test_tabledap_reader_get_dataset_metadata(get_session_mock, tabledap_metadata_json):
+    mock_get = get_session_mock.return_value.get
     bad = {
         "table": {
             "rows": [
@@ -121,13 +221,16 @@ def test_tabledap_reader_get_dataset_metadata(mock_get):
         }
     }
 
-    resp = mock.MagicMock()
-    resp.json.side_effect = [json.loads(test_data.read_text()), bad]
-    mock_get.return_value = resp
+    good_resp = mock.MagicMock()
+    good_resp.content = tabledap_metadata_json
+    bad_resp = mock.MagicMock()
+    bad_resp.content = json.dumps(bad).encode()
+    mock_get.side_effect = [good_resp, bad_resp]
     server = "http://erddap.invalid"
     dataset_id = "abc123"
     reader = TableDAPReader(server, dataset_id)
     metadata = reader._get_dataset_metadata(server, dataset_id)
+    assert mock_get.call_args.kwargs["timeout"] == 30
     assert metadata["cdm_data_type"] == "TimeSeries"
     assert metadata["variables"]["z"]["actual_range"] == [0.0, 0.0]
     assert metadata["variables"]["depth_to_water_level"]["status_flags"] == [
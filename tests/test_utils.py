@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """Tests for generic and utility functions."""
+import json
+
 from unittest import mock
 from urllib.parse import parse_qsl, urlparse
 
@@ -9,6 +11,7 @@ import pandas as pd
 import pytest
 
 from intake_erddap import utils
+from intake_erddap.cache import CacheStore
 
 
 class Something:
@@ -17,12 +20,20 @@ class Something:
     pass
 
 
-@mock.patch("pandas.read_csv")
-def test_category_and_key(mock_read_csv):
+def serve_csv(get_session_mock, df):
+    """Make the mocked shared session respond with ``df`` as CSV."""
+    resp = mock.MagicMock()
+    resp.content = df.to_csv(index=False).encode()
+    get_session_mock.return_value.get.return_value = resp
+    return get_session_mock.return_value.get
+
+
+@mock.patch("intake_erddap.utils.get_session")
+def test_category_and_key(get_session_mock):
     df_mock = pd.DataFrame()
     df_mock["Category"] = ["wind_speed", "WIND_SPEED_GUST"]
     df_mock["URL"] = ["URL1", "URL2"]
-    mock_read_csv.return_value = df_mock
+    serve_csv(get_session_mock, df_mock)
     server = "http://erddap.invalid/erddap"
     df = utils.return_category_options(server, "standard_name")
     assert set(df["Category"]) - set(df_mock["Category"]) == set()
@@ -39,30 +50,139 @@ def test_category_and_key(mock_read_csv):
     assert match_to_key == ["wind_speed"]
 
 
-@mock.patch("requests.get")
-def test_get_erddap_metadata(requests_mock):
+@mock.patch("intake_erddap.utils.get_session")
+def test_match_key_to_category_patterns(get_session_mock):
+    serve_csv(
+        get_session_mock,
+        pd.DataFrame(
+            {
+                "Category": [
+                    "sea_water_temperature",
+                    "sea_surface_temperature",
+                    "salinity",
+                    "SEA_WATER_TEMPERATURE",
+                ]
+            }
+        ),
+    )
+    server = "http://erddap.invalid/erddap"
+    criteria = {
+        "temp": {
+            "standard_name": "sea_water_temperature$",
+            "long_name": "(?i)SEA_SURFACE",
+        },
+        "water": {
+            "standard_name": "sea_water",
+            "long_name": "salinity$",
+        },
+    }
+    # The (?i) flag applies to its own pattern only
+    assert utils.match_key_to_category(server, "temp", criteria=criteria) == [
+        "sea_water_temperature",
+        "sea_surface_temperature",
+    ]
+    assert utils.match_key_to_category(server, "water", criteria=criteria) == [
+        "sea_water_temperature",
+        "salinity",
+    ]
+    # Keys outside the criteria only match a category of the same name
+    assert utils.match_key_to_category(server, "salinity", criteria=criteria) == [
+        "salinity"
+    ]
+    assert utils.match_key_to_category(server, "oxygen", criteria=criteria) == []
+
+
+@mock.patch("intake_erddap.utils.get_session")
+def test_match_key_to_category_regex_syntax(get_session_mock):
+    """Criteria use the ``regex`` module's syntax, as in cf_pandas."""
+    serve_csv(get_session_mock, pd.DataFrame({"Category": ["TEMP", "salinity", "bb"]}))
+    server = "http://erddap.invalid/erddap"
+    for pattern in ["sea_water_temp|(?i)TEMP", r"\p{Lu}EMP"]:
+        criteria = {"temp": {"standard_name": pattern}}
+        assert utils.match_key_to_category(server, "temp", criteria=criteria) == [
+            "TEMP"
+        ]
+    # Group numbers are not shifted by the other patterns
+    criteria = {"double": {"standard_name": "(s)alinity", "name": r"(b)\1"}}
+    assert utils.match_key_to_category(server, "double", criteria=criteria) == [
+        "salinity",
+        "bb",
+    ]
+
+
+@mock.patch("pandas.read_csv", wraps=pd.read_csv)
+@mock.patch("intake_erddap.utils.get_session")
+def test_return_category_values(get_session_mock, mock_read_csv):
+    get = serve_csv(
+        get_session_mock,
+        pd.DataFrame(
+            {"Category": ["wind_speed", "WIND_SPEED_GUST"], "URL": ["URL1", "URL2"]}
+        ),
+    )
+    server = "http://erddap.invalid/erddap"
+    values = utils.return_category_values(server, "standard_name")
+    assert isinstance(values, np.ndarray)
+    assert values.tolist() == ["wind_speed", "WIND_SPEED_GUST"]
+    assert get.call_args.args == (
+        "http://erddap.invalid/erddap/categorize/standard_name/index.csv?page=1&itemsPerPage=100000",
+    )
+    assert get.call_args.kwargs["timeout"] == utils.HTTP_TIMEOUT
+    assert mock_read_csv.call_args.kwargs["usecols"] == ["Category"]
+    assert mock_read_csv.call_args.kwargs["engine"] == utils.CSV_ENGINE
+
+
+def test_category_options_cached(tmp_path):
+    http_client = mock.MagicMock()
+    http_client.get.return_value.iter_content.return_value = [
+        b"Category,URL\nwind_speed,URL1\n"
+    ]
+    server = "http://erddap.invalid/erddap"
+    first = utils.return_category_options(
+        server, cache_store=CacheStore(cache_dir=tmp_path, http_client=http_client)
+    )
+    first["Category"] = ["changed"]
+    # A new store over the same cache directory, as a later catalog build makes
+    second = utils.return_category_options(
+        server, cache_store=CacheStore(cache_dir=tmp_path, http_client=http_client)
+    )
+    assert http_client.get.call_count == 1
+    assert second["Category"].tolist() == ["wind_speed"]
+
+    # A disabled cache store always goes back to the server
+    with mock.patch("pandas.read_csv", return_value=first) as read_csv:
+        utils.return_category_options(
+            server, cache_store=CacheStore(cache_dir=tmp_path, cache_period=0)
+        )
+    assert read_csv.call_args.args[0].startswith(server)
+
+
+@mock.patch("intake_erddap.utils.get_session")
+def test_get_erddap_metadata(get_session_mock):
+    requests_mock = get_session_mock.return_value.get
     resp = mock.MagicMock()
-    resp.json.return_value = {
-        "table": {
-            "columnNames": [
-                "datasetID",
-                "some_string",
-                "some_int",
-                "some_float",
-                "some_double",
-            ],
-            "columnTypes": [
-                "String",
-                "String",
-                "int",
-                "float",
-                "double",
-            ],
-            "rows": [
-                ["abc123", "value", "1", "2.0", "3.0"],
-            ],
+    resp.content = json.dumps(
+        {
+            "table": {
+                "columnNames": [
+                    "datasetID",
+                    "some_string",
+                    "some_int",
+                    "some_float",
+                    "some_double",
+                ],
+                "columnTypes": [
+                    "String",
+                    "String",
+                    "int",
+                    "float",
+                    "double",
+                ],
+                "rows": [
+                    ["abc123", "value", "1", "2.0", "3.0"],
+                ],
+            }
         }
-    }
+    ).encode()
     requests_mock.return_value = resp
 
     server = "https://erddap.invalid/erddap"
@@ -74,10 +194,11 @@ def test_get_erddap_metadata(requests_mock):
     assert data["abc123"]["some_float"] == 2.0
     assert data["abc123"]["some_double"] == 3.0
     assert requests_mock.call_args.args == (
-        "https://erddap.invalid/erddap/tabledap/allDatasets.json?datasetID%2Cinstitution%2Ctitle"
-        "%2Csummary%2CminLongitude%2CmaxLongitude%2CminLatitude%2CmaxLatitude%2CminTime%2CmaxTime"
-        "%2Cgriddap%2Ctabledap",
+        "https://erddap.invalid/erddap/tabledap/allDatasets.json?datasetID,institution,title"
+        ",summary,minLongitude,maxLongitude,minLatitude,maxLatitude,minTime,maxTime"
+        ",griddap,tabledap",
     )
+    assert requests_mock.call_args.kwargs == {"timeout": utils.HTTP_TIMEOUT}
 
     constraints = {
         "min_lon": -72.8,
@@ -100,6 +221,73 @@ def test_get_erddap_metadata(requests_mock):
     }
 
 
+def test_get_erddap_metadata_cached(tmp_path):
+    resp = mock.MagicMock()
+    resp.iter_content.return_value = [
+        json.dumps(
+            {
+                "table": {
+                    "columnNames": ["datasetID", "minLongitude"],
+                    "columnTypes": ["String", "double"],
+                    "rows": [["abc123", "-72.5"]],
+                }
+            }
+        ).encode()
+    ]
+    http_client = mock.MagicMock()
+    http_client.get.return_value = resp
+    cache_store = CacheStore(cache_dir=tmp_path, http_client=http_client)
+
+    server = "https://erddap.invalid/erddap"
+    for _ in range(2):
+        data = utils.get_erddap_metadata(
+            server, {"min_lon": -72.8}, cache_store=cache_store
+        )
+        assert data == {"abc123": {"datasetID": "abc123", "minLongitude": -72.5}}
+    # The second call is answered from the on-disk cache
+    assert http_client.get.call_count == 1
+    assert http_client.get.call_args.kwargs["timeout"] == utils.HTTP_TIMEOUT
+
+
+def test_get_session_is_shared():
+    session = utils.get_session()
+    assert session is utils.get_session()
+    adapter = session.get_adapter("https://erddap.invalid")
+    assert adapter._pool_maxsize == 16
+    assert adapter.max_retries.total == 3
+
+
+def test_get_erddap_metadata_many():
+    def get(url, timeout):
+        dataset_id = "east" if "maxLongitude%3E=-72.8" in url else "west"
+        resp = mock.MagicMock()
+        resp.content = json.dumps(
+            {
+                "table": {
+                    "columnNames": ["datasetID"],
+                    "columnTypes": ["String"],
+                    "rows": [[dataset_id]],
+                }
+            }
+        ).encode()
+        return resp
+
+    http_client = mock.MagicMock()
+    http_client.get.side_effect = get
+    server = "https://erddap.invalid/erddap"
+    data = utils.get_erddap_metadata_many(
+        server,
+        [{"min_lon": -72.8}, {"min_lon": -140}, {"min_lon": -72.8, "unused": 1}],
+        http_client=http_client,
+    )
+    assert [list(d) for d in data] == [["east"], ["west"], ["east"]]
+    # The third set of constraints makes the same query as the first
+    assert http_client.get.call_count == 2
+    data[0].pop("east")
+    assert list(data[2]) == ["east"]
+    assert utils.get_erddap_metadata_many(server, []) == []
+
+
 def test_bad_row_in_json():
     column_names = [
         "dataset_id",
@@ -129,6 +317,10 @@ def test_bad_row_in_json():
     with pytest.raises(TypeError):
         utils.parse_row(column_names, dtypes, row)
 
+    converters = utils.compile_converters(dtypes)
+    entry = utils.parse_row(column_names, dtypes, ["blah3", "2", "4.5"], converters)
+    assert entry == {"dataset_id": "blah3", "something": 2, "else": 4.5}
+
 
 def test_parser_error_response():
 
@@ -148,3 +340,106 @@ def test_parser_error_response():
     }
     result = utils.parse_erddap_tabledap_response(response_data)
     assert set(result.keys()) == set(["valid", "valid_float"])
+
+
+def test_parser_as_dataframe():
+    response_data = {
+        "table": {
+            "columnNames": ["datasetID", "institution", "count", "minLongitude"],
+            "columnTypes": ["String", "String", "int", "double"],
+            "rows": [
+                ["abc123", "FOMO", 1, "-72.5"],
+                ["def456", None, None, None],
+                ["ghi789", "Axiom", 3, None],
+            ],
+        }
+    }
+    df = utils.parse_erddap_tabledap_response(response_data, as_dataframe=True)
+    assert isinstance(df, pd.DataFrame)
+    assert df.index.tolist() == ["abc123", "ghi789"]
+    assert df.loc["abc123", "count"] == 1
+    assert df.loc["abc123", "minLongitude"] == -72.5
+    assert np.isnan(df.loc["ghi789", "minLongitude"])
+
+
+def test_parser_error_response_warns_once(caplog):
+    response_data = {
+        "table": {
+            "columnNames": ["datasetID", "count"],
+            "columnTypes": ["String", "int"],
+            "rows": [["a", None], ["b", None], ["c", "x"], ["d", "y"], ["e", 1]],
+        }
+    }
+    with caplog.at_level("WARNING", logger="intake-erddap"):
+        result = utils.parse_erddap_tabledap_response(response_data)
+    assert list(result) == ["e"]
+    assert [r.getMessage() for r in caplog.records] == [
+        "ERDDAP Returned an invalid null value for an integer. Skipping 2 datasets.",
+        "Encountered invalid values while parsing 2 rows from ERDDAP.",
+    ]
+
+
+def test_parser_error_response_in_parallel(monkeypatch):
+    monkeypatch.setattr(utils, "_GIL_ENABLED", False)
+    monkeypatch.setattr(utils, "_PARALLEL_PARSE_MIN_ROWS", 1)
+    test_parser_error_response()
+
+
+def test_parser_preserves_values():
+    response_data = {
+        "table": {
+            "columnNames": ["datasetID", "institution", "count", "minLongitude"],
+            "columnTypes": ["String", "String", "long", "double"],
+            "rows": [
+                ["abc123", None, "9007199254740993", "-72.5"],
+                ["def456", "FOMO", 2, None],
+                ["def456", "Axiom", 3, 1.0],
+            ],
+        }
+    }
+    result = utils.parse_erddap_tabledap_response(response_data)
+    assert set(result) == {"abc123", "def456"}
+    assert result["abc123"]["institution"] is None
+    assert result["abc123"]["count"] == 9007199254740993
+    assert result["abc123"]["minLongitude"] == -72.5
+    # Later rows for the same dataset replace earlier ones
+    assert result["def456"] == {
+        "datasetID": "def456",
+        "institution": "Axiom",
+        "count": 3,
+        "minLongitude": 1.0,
+    }
+
+
+def test_parser_coerces_like_parse_row():
+    response_data = {
+        "table": {
+            "columnNames": ["datasetID", "count", "minLongitude"],
+            "columnTypes": ["String", "int", "double"],
+            "rows": [
+                ["nan_double", 1, "NaN"],
+                ["fractional_int", 2.7, -72.5],
+                ["fractional_int_string", "2.7", -72.5],
+            ],
+        }
+    }
+    result = utils.parse_erddap_tabledap_response(response_data)
+    # Same as parse_row: float("NaN") is NaN, int(2.7) is 2 and int("2.7") fails
+    assert list(result) == ["nan_double", "fractional_int"]
+    assert np.isnan(result["nan_double"]["minLongitude"])
+    assert result["fractional_int"]["count"] == 2
+
+
+def test_parser_integral_double():
+    response_data = {
+        "table": {
+            "columnNames": ["datasetID", "minLongitude"],
+            "columnTypes": ["String", "double"],
+            "rows": [["a", -180], ["b", 10]],
+        }
+    }
+    result = utils.parse_erddap_tabledap_response(response_data)
+    assert result["a"]["minLongitude"] == -180.0
+    assert isinstance(result["a"]["minLongitude"], float)
+    df = utils.parse_erddap_tabledap_response(response_data, as_dataframe=True)
+    assert df["minLongitude"].dtype == np.float64